@@ -0,0 +1,124 @@
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tracemalloc
+
+from tabulate import tabulate
+
+import botex_reader
+from compact_conversation import SHARED_TABLE, CompactConversation
+
+# Measures the memory that a runner needs per bot to hold the conversation
+# histories of many concurrent grief_support and mftrust participants: as
+# lists of dicts (the way botex keeps them) and as CompactConversation.
+#
+#   python code/benchmark_conversation_memory.py [--bots 10 100 1000]
+#
+# The histories are taken from the recorded conversations in BOTEX_DB and
+# reused round-robin. Every bot gets freshly created strings, as if it had
+# scraped its pages itself, and its answers are made unique. Each
+# measurement runs in its own process and reports the growth of the resident
+# set size (RSS) and the memory allocated by Python (tracemalloc) per bot.
+# RSS is coarse for few bots, as freed memory is reused. After the
+# measurement, all compact conversations are closed, and the strings that
+# are still interned are counted (0 means that nothing leaks).
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+SESSION_NAMES = ('grief_support', 'mftrust')
+BOTS = [10, 100, 1000]
+
+
+def recorded_conversations(botex_db=BOTEX_DB):
+    names = {
+        p['participant_id']: p['session_name']
+        for p in botex_reader.read_participants_from_botex_db(
+            botex_db=botex_db
+        )
+    }
+    return [
+        c['conversation']
+        for c in botex_reader.read_conversations_from_botex_db(
+            botex_db=botex_db
+        )
+        if names.get(c['id']) in SESSION_NAMES
+    ]
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+def measure(kind, bots, botex_db=BOTEX_DB):
+    """RSS growth and allocated memory in KB per bot for bots conversations
+
+    Also returns the number of strings that stay interned after all
+    conversations were closed (None for dicts).
+    """
+    templates = recorded_conversations(botex_db)
+    gc.collect()
+    before = rss_kb()
+    tracemalloc.start()
+    held = []
+    try:
+        for i in range(bots):
+            messages = json.loads(templates[i % len(templates)])
+            for m in messages:
+                if m['role'] == 'assistant':
+                    m['content'] += f" [bot {i}]"
+            if kind == 'compact':
+                held.append(CompactConversation(messages))
+            else:
+                held.append(messages)
+        gc.collect()
+        allocated = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        rss = (rss_kb() - before) / bots
+    finally:
+        if kind == 'compact':
+            for conv in held:
+                conv.close()
+    left = len(SHARED_TABLE) if kind == 'compact' else None
+    return rss, allocated / bots, left
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory per bot of conversation histories"
+    )
+    parser.add_argument('--bots', type=int, nargs='+', default=BOTS)
+    parser.add_argument('--db', default=BOTEX_DB)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], int(args.child[1]), args.db)))
+        sys.exit()
+
+    def run(kind, bots):
+        out = subprocess.run(
+            [sys.executable, __file__, '--db', args.db,
+             '--child', kind, str(bots)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(out)
+
+    rows = []
+    for bots in args.bots:
+        (dicts_rss, dicts, _), (compact_rss, compact, left) = (
+            run('dicts', bots), run('compact', bots)
+        )
+        rows.append([
+            bots, dicts_rss, compact_rss, dicts, compact, dicts / compact,
+            left
+        ])
+    print(tabulate(rows, floatfmt='.1f', headers=[
+        'bots', 'dicts RSS KB/bot', 'compact RSS KB/bot',
+        'dicts alloc KB/bot', 'compact alloc KB/bot', 'ratio (alloc)',
+        'strings after close'
+    ]))
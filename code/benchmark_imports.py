@@ -0,0 +1,46 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Compares the start-up cost of the analysis scripts before and after they
+# switched from botex to code/botex_reader.py. Every import runs in a fresh
+# interpreter, and the median wall time over several runs is reported.
+#
+#   python code/benchmark_imports.py [--runs 5]
+#
+# For a per-module breakdown use: python -X importtime -c "import botex"
+
+MODULES = ['botex', 'botex_reader', 'tabulate', 'scipy.stats']
+RUNS = 5
+
+
+def import_time(module, runs=RUNS):
+    """Median wall time in seconds of a fresh interpreter importing module"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, '-c', f"import {module}"],
+            cwd='code', check=True, capture_output=True
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import times")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--runs', type=int, default=RUNS)
+    args = parser.parse_args()
+
+    baseline = import_time('sys', args.runs)
+    print(f"{'interpreter start':<20}{baseline:8.3f}s")
+    for module in args.modules:
+        try:
+            t = import_time(module, args.runs)
+        except subprocess.CalledProcessError:
+            print(f"{module:<20}  not installed")
+            continue
+        print(f"{module:<20}{t:8.3f}s  (+{t - baseline:.3f}s)")
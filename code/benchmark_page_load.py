@@ -0,0 +1,195 @@
+import argparse
+import gzip
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+
+from tabulate import tabulate
+
+import replay_load
+
+# Measures what bot-heavy sessions cost an oTree server per page view: the
+# bytes sent (page and static assets) and the time until the page arrives.
+# Many simulated participants click through a session at the same time.
+# Each one has its own browser cache, because botex starts a fresh browser
+# for every bot: assets are fetched once, and again only when the cache
+# headers do not allow to reuse them (conditional requests count as well).
+#
+# Compare the plain oTree server with the caching one:
+#
+#   cd otree && otree prodserver 8000
+#   cd otree && python cached_prodserver.py 8001     # in a copy of otree/
+#   python code/benchmark_page_load.py http://localhost:8000 \
+#       http://localhost:8001 --participants 500
+#
+# Use a separate copy of the otree folder (and database) for each server.
+# Participants enter answers that pass the form validation, not the
+# recorded answers of bots (see replay_load.py for those).
+
+CONFIG = 'stakeholder'
+PARTICIPANTS = 500
+MAX_PAGES = 100
+WAIT_POLL_SECONDS = 0.5
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class AssetParser(HTMLParser):
+    """Collects the stylesheets, scripts and images of a page"""
+
+    def __init__(self):
+        super().__init__()
+        self.assets = []
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == 'link' and a.get('rel') == 'stylesheet' and a.get('href'):
+            self.assets.append(a['href'])
+        elif tag in ('script', 'img') and a.get('src'):
+            self.assets.append(a['src'])
+
+
+class Browser:
+    """HTTP client with a private cache that follows the cache headers"""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.cache = {}     # url -> (expires, etag)
+
+    def fetch(self, url, data=None, headers=None):
+        """Return (final url, body, bytes received, status, headers)
+
+        status is None if the request failed without an HTTP response.
+        """
+        req = urllib.request.Request(url, data=data, headers={
+            'Accept-Encoding': 'gzip', **(headers or {})
+        })
+        try:
+            with urllib.request.urlopen(
+                req, timeout=replay_load.TIMEOUT_SECONDS
+            ) as r:
+                raw = r.read()
+                if r.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(raw)
+                else:
+                    body = raw
+                return r.geturl(), body, len(raw), r.status, r.headers
+        except urllib.error.HTTPError as e:
+            return url, b'', len(e.read()), e.code, e.headers
+        except (urllib.error.URLError, OSError):
+            # Includes connection resets and timeouts
+            return url, b'', 0, None, {}
+
+    def asset(self, url):
+        expires, etag = self.cache.get(url, (0, None))
+        if expires > time.time():
+            return
+        headers = {'If-None-Match': etag} if etag else {}
+        _, _, size, status, resp_headers = self.fetch(url, headers=headers)
+        with self.stats.lock:
+            self.stats.asset_bytes += size
+            self.stats.asset_requests += 1
+            if status is None or status >= 400:
+                self.stats.errors += 1
+        max_age = MAX_AGE.search(resp_headers.get('Cache-Control') or '')
+        self.cache[url] = (
+            time.time() + int(max_age.group(1)) if max_age else 0,
+            resp_headers.get('ETag') or etag
+        )
+
+    def page(self, url, data=None):
+        start = time.perf_counter()
+        final_url, body, size, status, _ = self.fetch(url, data)
+        elapsed = time.perf_counter() - start
+        html = body.decode(errors='replace')
+        with self.stats.lock:
+            self.stats.page_bytes += size
+            self.stats.page_times.append(elapsed)
+            if status is None or status >= 400:
+                self.stats.errors += 1
+        parser = AssetParser()
+        parser.feed(html)
+        for asset in parser.assets:
+            self.asset(urllib.parse.urljoin(final_url, asset))
+        return final_url, html
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.page_times = []
+        self.page_bytes = 0
+        self.asset_bytes = 0
+        self.asset_requests = 0
+        self.errors = 0
+        self.finished = 0
+
+
+def participant(url, stats):
+    browser = Browser(stats)
+    for _ in range(MAX_PAGES):
+        url, html = browser.page(url)
+        if 'OutOfRangeNotification' in url:
+            with stats.lock:
+                stats.finished += 1
+            return
+        form = replay_load.FormParser()
+        form.feed(html)
+        if form.action is None:
+            time.sleep(WAIT_POLL_SECONDS)
+            continue
+        url, _ = browser.page(
+            urllib.parse.urljoin(url, form.action),
+            replay_load.form_data(form, {})
+        )
+
+
+def run(server, config=CONFIG, participants=PARTICIPANTS):
+    stats = Stats()
+    urls = replay_load.create_session(config, participants, server)
+    threads = [
+        threading.Thread(target=participant, args=(url, stats))
+        for url in urls
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats.duration = time.perf_counter() - start
+    return stats
+
+
+def summary(server, stats):
+    times = sorted(stats.page_times)
+    n = len(times)
+    return [
+        server, stats.finished, n, stats.duration,
+        (stats.page_bytes + stats.asset_bytes) / n / 1024,
+        stats.page_bytes / n / 1024,
+        stats.asset_requests / n,
+        times[n // 2] * 1000, times[min(n - 1, int(0.95 * n))] * 1000,
+        stats.errors,
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bytes and page times under many concurrent bots"
+    )
+    parser.add_argument('servers', nargs='+', help="oTree server URLs")
+    parser.add_argument('--config', default=CONFIG)
+    parser.add_argument('--participants', type=int, default=PARTICIPANTS)
+    args = parser.parse_args()
+
+    rows = [
+        summary(server, run(server, args.config, args.participants))
+        for server in args.servers
+    ]
+    print(tabulate(rows, floatfmt='.1f', headers=[
+        'server', 'finished', 'page requests', 'seconds', 'KB/request',
+        'page KB/request', 'assets/request', 'p50 ms', 'p95 ms', 'errors'
+    ]))
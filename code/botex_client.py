@@ -0,0 +1,119 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Thin client for code/botex_daemon.py. It only uses the standard library,
+# so it starts quickly.
+#
+#   python code/botex_client.py run-bot <participant url> --wait
+#   python code/botex_client.py run-session mftrust 2
+#   python code/botex_client.py status [job id]
+#   python code/botex_client.py benchmark <url 1> <url 2>
+#
+# benchmark compares the time to the first LLM call of a cold script run
+# (fresh interpreter that imports botex, run on url 1) with a job on the
+# warm daemon (run on url 2). Each bot needs its own participant URL.
+
+DAEMON_URL = 'http://127.0.0.1:8765'
+DAEMON_SCRIPT = 'code/botex_daemon.py'
+POLL_SECONDS = 1
+
+
+def _request(path, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(
+        DAEMON_URL + path, data=data,
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(req) as r:
+            return json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        raise SystemExit(f"{e.code}: {json.loads(e.read())['error']}")
+
+
+def submit(job):
+    return _request('/jobs', job)
+
+
+def status(job_id=None):
+    return _request(f"/jobs/{job_id}" if job_id else '/jobs')
+
+
+def wait(job_id):
+    while True:
+        job = status(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(POLL_SECONDS)
+
+
+def show(job):
+    """Print a job, and the traceback of a failed one on stderr"""
+    tb = job.pop('traceback', None)
+    print(json.dumps(job, indent=2))
+    if tb:
+        print(tb, file=sys.stderr, end='')
+
+
+def cold_time_to_first_call(url):
+    t0 = time.time()
+    out = subprocess.run(
+        [sys.executable, DAEMON_SCRIPT, '--once', url],
+        capture_output=True, text=True, check=True
+    ).stdout
+    job = json.loads(out.strip().splitlines()[-1])
+    return job['first_llm_call_at'] - t0 if job['first_llm_call_at'] else None
+
+
+def warm_time_to_first_call(url):
+    t0 = time.time()
+    job = wait(submit({'type': 'run_bot', 'url': url})['id'])
+    return job['first_llm_call_at'] - t0 if job['first_llm_call_at'] else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client for botex_daemon.py")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('run-bot', help="run a bot on a participant URL")
+    p.add_argument('url')
+    p.add_argument('--wait', action='store_true')
+    p = sub.add_parser('run-session', help="create and run a session")
+    p.add_argument('config_name')
+    p.add_argument('npart', type=int)
+    p.add_argument('--wait', action='store_true')
+    p = sub.add_parser('status', help="show one or all jobs")
+    p.add_argument('job_id', nargs='?', type=int)
+    p = sub.add_parser('benchmark', help="cold run vs. warm daemon")
+    p.add_argument('cold_url')
+    p.add_argument('warm_url')
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        cold = cold_time_to_first_call(args.cold_url)
+        warm = warm_time_to_first_call(args.warm_url)
+        print(f"Time to first LLM call, cold script: {cold:.2f}s")
+        print(f"Time to first LLM call, warm daemon: {warm:.2f}s")
+    elif args.command == 'status':
+        jobs = status(args.job_id)
+        if args.job_id:
+            show(jobs)
+        else:
+            print(json.dumps(jobs, indent=2))
+    else:
+        if args.command == 'run-bot':
+            job = submit({'type': 'run_bot', 'url': args.url})
+        else:
+            job = submit({
+                'type': 'run_session', 'config_name': args.config_name,
+                'npart': args.npart
+            })
+        if args.wait:
+            job = wait(job['id'])
+        show(job)
+        if job['status'] == 'failed':
+            raise SystemExit(1)
@@ -0,0 +1,208 @@
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The heavy imports happen once, when the daemon starts
+import botex
+import litellm
+
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+# A long-lived worker that keeps botex and litellm imported and the
+# configuration loaded, and runs bot jobs that it receives over a local HTTP
+# endpoint. Short runs no longer pay for interpreter start-up and imports.
+# Use code/botex_client.py to submit jobs and to compare the time to the
+# first LLM call of a cold script run with the warm daemon.
+#
+#   python code/botex_daemon.py                  # serve on localhost:8765
+#   python code/botex_daemon.py --once <url>     # run one bot and exit
+#
+# Endpoints:
+#   POST /jobs  {"type": "run_bot", "url": "...", "kwargs": {...}}
+#               {"type": "run_session", "config_name": "mftrust",
+#                "npart": 2, "kwargs": {...}}
+#   GET /jobs/<id>, GET /jobs, GET /health
+#
+# Failed jobs have the error and its traceback in their status. Finished
+# jobs are dropped, oldest first, once there are more than
+# MAX_FINISHED_JOBS of them.
+#
+# botex starts a fresh Chrome instance for each bot, so the browser itself
+# is not kept warm.
+
+HOST = '127.0.0.1'
+PORT = 8765
+BOTEX_DB = os.environ.get('BOTEX_DB', 'botex.sqlite3')
+# Finished jobs are kept for GET /jobs until there are more than this many
+MAX_FINISHED_JOBS = 1000
+
+# Jobs are only changed and read while holding _lock; replies get copies
+_jobs = {}
+_running = set()
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+
+def _record_llm_call(kwargs, response, start_time, end_time):
+    # With several jobs running at once, this is the first call of any job
+    start = start_time.timestamp()
+    with _lock:
+        for job_id in _running:
+            job = _jobs[job_id]
+            if job['received_at'] <= start and (
+                    job['first_llm_call_at'] is None
+                    or start < job['first_llm_call_at']):
+                job['first_llm_call_at'] = start
+
+
+litellm.success_callback.append(_record_llm_call)
+litellm.failure_callback.append(_record_llm_call)
+
+
+def _update(job_id, **changes):
+    with _lock:
+        _jobs[job_id].update(changes)
+
+
+def run_job(job):
+    kwargs = dict(job.get('kwargs') or {}, botex_db=BOTEX_DB)
+    if job['type'] == 'run_bot':
+        botex.run_single_bot(url=job['url'], **kwargs)
+    elif job['type'] == 'run_session':
+        session = botex.init_otree_session(
+            config_name=job['config_name'], npart=job['npart'],
+            botex_db=BOTEX_DB
+        )
+        _update(job['id'], session_id=session['session_id'])
+        botex.run_bots_on_session(session_id=session['session_id'], **kwargs)
+    else:
+        raise ValueError(f"Unknown job type {job['type']!r}")
+
+
+def _prune():
+    finished = [
+        id for id, job in _jobs.items()
+        if job['status'] in ('done', 'failed')
+    ]
+    for id in finished[:-MAX_FINISHED_JOBS]:
+        del _jobs[id]
+
+
+def _execute(job_id):
+    with _lock:
+        _jobs[job_id].update(status='running', started_at=time.time())
+        _running.add(job_id)
+        job = dict(_jobs[job_id])
+    try:
+        run_job(job)
+        changes = {'status': 'done'}
+    except Exception as e:
+        logging.exception(f"Job {job_id} failed")
+        changes = {
+            'status': 'failed', 'error': repr(e),
+            'traceback': traceback.format_exc()
+        }
+    with _lock:
+        _jobs[job_id].update(changes, finished_at=time.time())
+        _running.discard(job_id)
+        _prune()
+
+
+def get_job(job_id):
+    """Return a copy of a job, None if there is no such job"""
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def submit(job):
+    job = dict(
+        job, id=next(_ids), status='queued', received_at=time.time(),
+        first_llm_call_at=None
+    )
+    with _lock:
+        _jobs[job['id']] = job
+        reply = dict(job)
+    threading.Thread(target=_execute, args=(job['id'],), daemon=True).start()
+    return reply
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok', 'pid': os.getpid()})
+        elif self.path == '/jobs':
+            with _lock:
+                jobs = [dict(job) for job in _jobs.values()]
+            self._reply(200, jobs)
+        elif self.path.startswith('/jobs/'):
+            try:
+                job = get_job(int(self.path.split('/')[-1]))
+            except ValueError:
+                job = None
+            if job is None:
+                self._reply(404, {'error': 'no such job'})
+                return
+            self._reply(200, job)
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length))
+            if job.get('type') not in ('run_bot', 'run_session'):
+                raise ValueError("type must be run_bot or run_session")
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        self._reply(202, submit(job))
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm botex worker daemon")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument(
+        '--once', metavar='URL',
+        help="run a single bot without serving, for cold start comparisons"
+    )
+    args = parser.parse_args()
+
+    if args.once:
+        job = {
+            'type': 'run_bot', 'url': args.once, 'id': 0, 'received_at': 0,
+            'first_llm_call_at': None
+        }
+        _jobs[0] = job
+        _execute(0)
+        print(json.dumps(get_job(0)))
+    else:
+        server = ThreadingHTTPServer((HOST, args.port), Handler)
+        logging.info(f"botex daemon listening on http://{HOST}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,176 @@
+import logging
+import queue
+from collections import deque
+import sqlite3
+import threading
+import time
+
+# Helpers for writing to the botex database from many concurrent bots.
+#
+# enable_wal() switches the database to write-ahead logging. The setting is
+# stored in the database file, so it also applies to the connections that
+# botex opens itself: readers no longer block the writer and vice versa.
+#
+# BotexDBWriter is a single writer thread that owns the only write connection.
+# Bots (or any other thread) hand off rows via submit() and return at once.
+# The writer groups whatever is queued into one transaction, which avoids
+# "database is locked" errors and the cost of one commit per row. Only
+# locked or busy databases are retried. If a batch cannot be written, its
+# rows are written one by one, so a single bad statement only loses its own
+# row.
+
+BUSY_TIMEOUT_MS = 30000
+# Commit latencies in metrics() are those of the last LATENCY_SAMPLES commits
+LATENCY_SAMPLES = 10000
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def enable_wal(botex_db):
+    """Switch a botex database to WAL mode and return the journal mode"""
+    conn = sqlite3.connect(botex_db)
+    try:
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+    return mode
+
+
+class BotexDBWriter:
+    """Single-writer queue that batches statements into grouped transactions
+
+    Usage:
+        writer = BotexDBWriter('botex.sqlite3')
+        writer.submit("INSERT INTO ... VALUES (?, ?)", (a, b))
+        ...
+        writer.close()  # flushes everything that is still queued
+        print(writer.metrics())
+    """
+
+    def __init__(
+            self, botex_db, batch_size=500, flush_interval=0.25,
+            max_retries=5
+        ):
+        self.botex_db = botex_db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._commits = 0
+        self._rows = 0
+        self._commit_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._max_queue_depth = 0
+        self.failed_rows = []
+        enable_wal(botex_db)
+        self._thread = threading.Thread(
+            target=self._run, name="botex-db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, sql, params=()):
+        """Queue a statement for writing. Returns immediately."""
+        # close() takes the same lock, so no row is queued after the writer
+        # has seen the queue empty and stopped
+        with self._submit_lock:
+            if self._closed.is_set():
+                raise RuntimeError("BotexDBWriter is closed")
+            self._queue.put((sql, params))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+
+    def close(self):
+        """Stop accepting statements, write all queued rows and stop"""
+        with self._submit_lock:
+            self._closed.set()
+        self._thread.join()
+
+    def metrics(self):
+        """Return commit latency and queue depth metrics"""
+        with self._lock:
+            lat = sorted(self._commit_latencies)
+            n = len(lat)
+            return {
+                'commits': self._commits,
+                'rows': self._rows,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'mean_commit_ms': 1000 * sum(lat) / n if n else None,
+                'p95_commit_ms': 1000 * lat[int(0.95 * (n - 1))] if n else None,
+                'max_commit_ms': 1000 * lat[-1] if n else None,
+            }
+
+    def _next_batch(self):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn, batch):
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                with conn:
+                    for sql, params in batch:
+                        conn.execute(sql, params)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == self.max_retries:
+                    raise
+                logging.warning(
+                    f"Writing {len(batch)} row(s) to {self.botex_db} "
+                    f"failed ({e}), retrying"
+                )
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            with self._lock:
+                self._commits += 1
+                self._rows += len(batch)
+                self._commit_latencies.append(time.perf_counter() - start)
+            return
+
+    def _write_rows(self, conn, batch):
+        for row in batch:
+            try:
+                self._write(conn, [row])
+            except sqlite3.Error:
+                logging.exception(
+                    f"Giving up on writing a row to {self.botex_db}, "
+                    f"keeping it in failed_rows: {row[0]}"
+                )
+                self.failed_rows.append(row)
+
+    def _run(self):
+        conn = sqlite3.connect(
+            self.botex_db, timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        # Safe with WAL and much faster than FULL; applies per connection
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while not (self._closed.is_set() and self._queue.empty()):
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                try:
+                    self._write(conn, batch)
+                except sqlite3.Error as e:
+                    logging.warning(
+                        f"Writing {len(batch)} row(s) to {self.botex_db} "
+                        f"failed ({e}), writing them one by one"
+                    )
+                    self._write_rows(conn, batch)
+        finally:
+            conn.close()
@@ -0,0 +1,141 @@
+import argparse
+import sqlite3
+
+import botex_reader
+
+# Full-text search over the free-text answers (messages, justifications,
+# feedback, ...) and the reasons that bots give for all of their answers.
+#
+# The index is an SQLite FTS5 table in the botex database. Updating it only
+# adds the participants that are not indexed yet, so it can be run
+# repeatedly while a batch is running.
+#
+#   python code/botex_fts.py index
+#   python code/botex_fts.py search 'trust*' --session mftrust --round 1
+#   python code/botex_fts.py search '"build a relationship"' --kind answer
+#
+# Queries use the FTS5 syntax: "a phrase", prefix*, AND/OR/NOT, NEAR(a b).
+# Results are ranked by bm25.
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+
+
+def create_index(conn):
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS bot_text_fts USING fts5(
+            text, session_name UNINDEXED, session_id UNINDEXED,
+            participant_id UNINDEXED, round UNINDEXED,
+            question_id UNINDEXED, kind UNINDEXED,
+            tokenize = 'porter unicode61'
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_text_fts_participants (
+            participant_id char(8) PRIMARY KEY
+        )
+    """)
+
+
+def _is_text(answer):
+    if not isinstance(answer, str) or not answer.strip():
+        return False
+    try:
+        float(answer)
+        return False
+    except ValueError:
+        return True
+
+
+def update_index(botex_db=BOTEX_DB):
+    """Index the responses of all participants that are not indexed yet"""
+    conn = sqlite3.connect(botex_db, timeout=30)
+    create_index(conn)
+    indexed = {r[0] for r in conn.execute(
+        "SELECT participant_id FROM bot_text_fts_participants"
+    )}
+    session_names = dict(conn.execute(
+        "SELECT DISTINCT session_id, session_name FROM participants"
+    ))
+    # Only the conversations in new are read and then marked as indexed,
+    # so conversations that are written meanwhile wait for the next update
+    new = [
+        id for id in botex_reader.read_conversation_ids(botex_db)
+        if id not in indexed
+    ]
+    if not new:
+        conn.close()
+        return 0
+    rows = []
+    for r in botex_reader.read_responses_from_botex_db(
+        botex_db=botex_db, ids=new
+    ):
+        key = (
+            session_names.get(r['session_id']), r['session_id'],
+            r['participant_id'], r['round'], r['question_id']
+        )
+        if _is_text(r['answer']):
+            rows.append((r['answer'], *key, 'answer'))
+        if r.get('reason'):
+            rows.append((r['reason'], *key, 'reason'))
+    with conn:
+        conn.executemany(
+            "INSERT INTO bot_text_fts VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO bot_text_fts_participants VALUES (?)",
+            [(id,) for id in new]
+        )
+    conn.close()
+    return len(rows)
+
+
+def search(
+        query, session_name=None, round=None, kind=None, limit=20,
+        botex_db=BOTEX_DB
+    ):
+    """Return the best matching texts for an FTS5 query as dicts"""
+    sql = """
+        SELECT session_name, session_id, participant_id, round, question_id,
+            kind, snippet(bot_text_fts, 0, '[', ']', '...', 16) AS snippet,
+            bm25(bot_text_fts) AS rank
+        FROM bot_text_fts WHERE bot_text_fts MATCH ?
+    """
+    params = [query]
+    for column, value in (
+            ('session_name', session_name), ('round', round),
+            ('kind', kind)):
+        if value is not None:
+            sql += f" AND {column} = ?"
+            params.append(value)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    conn = sqlite3.connect(botex_db)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute(sql, params)]
+    conn.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Full-text search over bot messages and rationales"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('index', help="add new participants to the index")
+    p = sub.add_parser('search', help="query the index")
+    p.add_argument('query')
+    p.add_argument('--session', help="session name, e.g. mftrust")
+    p.add_argument('--round', type=int)
+    p.add_argument('--kind', choices=('answer', 'reason'))
+    p.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        print(f"Indexed {update_index()} new text(s).")
+    else:
+        from tabulate import tabulate
+        rows = search(
+            args.query, args.session, args.round, args.kind, args.limit
+        )
+        print(tabulate(rows, headers="keys", floatfmt=".2f"))
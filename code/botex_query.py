@@ -0,0 +1,123 @@
+import argparse
+import csv
+import glob
+import json
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from tabulate import tabulate
+
+import botex_reader
+
+# Reads participants, conversations or responses from many botex databases
+# at once, e.g. one database per batch of runs. Each file is read by its own
+# worker process, so the run time scales with the number of cores. Rows get
+# a 'source' column with the file they came from.
+#
+# Sessions that appear in more than one file (e.g. a copied database) are
+# only kept once: from the file with the most rows for that session, or the
+# first file in sorted order if they are equally complete. Single bot runs
+# without an oTree session (session id 'unknown') are never de-duplicated.
+#
+#   python code/botex_query.py responses 'botex.sqlite3' 'data/external/*.sqlite3'
+#   python code/botex_query.py participants 'batches/*.sqlite3' --csv out.csv
+#
+#   rows = botex_query.read('responses', ['batches/*.sqlite3'])
+
+READERS = {
+    'participants': botex_reader.read_participants_from_botex_db,
+    'conversations': botex_reader.read_conversations_from_botex_db,
+    'responses': botex_reader.read_responses_from_botex_db,
+}
+
+
+def db_files(patterns):
+    """Expand glob patterns into a sorted list of unique files"""
+    files = set()
+    for pattern in patterns:
+        files.update(glob.glob(pattern, recursive=True))
+    return sorted(os.path.normpath(f) for f in files)
+
+
+# Session id of botex.run_single_bot() runs without a session
+NO_SESSION = 'unknown'
+
+
+def _session_id(kind, row):
+    if kind == 'conversations':
+        return json.loads(row['bot_parms'])['session_id']
+    return row['session_id']
+
+
+def _read_file(kind, path, session_id):
+    return path, READERS[kind](session_id=session_id, botex_db=path)
+
+
+def deduplicate(kind, results):
+    """Merge [(source, rows)] keeping every session from one source only
+
+    Returns the merged rows and {session_id: [dropped sources]}.
+    """
+    counts = defaultdict(Counter)
+    for source, rows in results:
+        for row in rows:
+            counts[_session_id(kind, row)][source] += 1
+    order = {source: i for i, (source, _) in enumerate(results)}
+    keep, dropped = {}, {}
+    for sid, by_source in counts.items():
+        if sid == NO_SESSION:
+            continue
+        ranked = sorted(by_source, key=lambda s: (-by_source[s], order[s]))
+        keep[sid] = ranked[0]
+        if len(ranked) > 1:
+            dropped[sid] = ranked[1:]
+    merged = [
+        dict(row, source=source)
+        for source, rows in results for row in rows
+        if keep.get(_session_id(kind, row), source) == source
+    ]
+    return merged, dropped
+
+
+def read(kind, patterns, session_id=None, workers=None):
+    """Read kind ('participants', 'conversations' or 'responses') from all
+    databases matching patterns in parallel. Returns (rows, dropped)."""
+    files = db_files(patterns)
+    if not files:
+        raise SystemExit(f"No database matches {' '.join(patterns)}")
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        results = list(ex.map(
+            _read_file, [kind] * len(files), files, [session_id] * len(files)
+        ))
+    return deduplicate(kind, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query many botex databases in parallel"
+    )
+    parser.add_argument('kind', choices=READERS)
+    parser.add_argument('patterns', nargs='+', help="database files or globs")
+    parser.add_argument('--session', help="only read this session id")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--csv', help="write the merged rows to this file")
+    args = parser.parse_args()
+
+    rows, dropped = read(args.kind, args.patterns, args.session, args.workers)
+    per_source = Counter(r['source'] for r in rows)
+    print(tabulate(
+        [
+            [source, n, len({_session_id(args.kind, r)
+                             for r in rows if r['source'] == source})]
+            for source, n in sorted(per_source.items())
+        ],
+        headers=['source', 'rows', 'sessions']
+    ))
+    for sid, sources in sorted(dropped.items()):
+        print(f"Session {sid} also found in {', '.join(sources)}, not used")
+    if args.csv and rows:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
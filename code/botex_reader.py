@@ -0,0 +1,167 @@
+import json
+import sqlite3
+
+# Read-only access to botex databases that only needs the standard library.
+#
+# The read_* functions return the same data as their botex counterparts but
+# do not import botex (and with it litellm, selenium, ...), which makes
+# analysis scripts start much faster. Optional heavy dependencies are only
+# imported when they are needed, e.g. zstandard for compact databases
+# written by conversation_store.py.
+#
+# See code/benchmark_imports.py for the import times.
+
+# Conversations are read in chunks of this many ids when only some are
+# needed
+IDS_PER_QUERY = 500
+# Botex starts every page prompt with one of these phrases
+NEW_PAGE_MARKERS = (
+    "This is the body text of the entry page",
+    "You have now proceeded to the next page",
+)
+
+
+def _connect(botex_db):
+    conn = sqlite3.connect(f"file:{botex_db}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _has_compact_conversations(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'compact_conversations'"
+    ).fetchone() is not None
+
+
+def is_compact_db(botex_db):
+    """True for compact databases written by conversation_store.py"""
+    conn = _connect(botex_db)
+    compact = _has_compact_conversations(conn)
+    conn.close()
+    return compact
+
+
+def _select_ids(conn, sql, ids):
+    """Run sql, which ends with 'WHERE id IN', for all ids in chunks"""
+    ids = list(ids)
+    rows = []
+    for i in range(0, len(ids), IDS_PER_QUERY):
+        chunk = ids[i:i + IDS_PER_QUERY]
+        rows += conn.execute(
+            f"{sql} ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall()
+    return rows
+
+
+def read_conversation_ids(botex_db=None):
+    """Return the ids (participant ids) of all stored conversations"""
+    conn = _connect(botex_db)
+    table = (
+        'compact_conversations' if _has_compact_conversations(conn)
+        else 'conversations'
+    )
+    ids = [r[0] for r in conn.execute(f"SELECT id FROM {table}")]
+    conn.close()
+    return ids
+
+
+def read_participants_from_botex_db(session_id=None, botex_db=None):
+    """Read the participants table of a botex database as a list of dicts"""
+    conn = _connect(botex_db)
+    if session_id:
+        rows = conn.execute(
+            "SELECT * FROM participants WHERE session_id = ?", (session_id,)
+        ).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM participants").fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def read_conversations_from_botex_db(session_id=None, botex_db=None, ids=None):
+    """Read the conversations of a botex database as a list of dicts
+
+    Each dict has the keys id, bot_parms and conversation (JSON strings).
+    If ids is given, only the conversations with these ids are read.
+    """
+    conn = _connect(botex_db)
+    if _has_compact_conversations(conn):
+        conn.close()
+        import conversation_store
+        return conversation_store.read_conversations_from_botex_db(
+            botex_db, session_id, ids
+        )
+    sql = "SELECT id, bot_parms, conversation FROM conversations"
+    if ids is None:
+        rows = conn.execute(sql).fetchall()
+    else:
+        rows = _select_ids(conn, f"{sql} WHERE id IN", ids)
+    rows = [dict(r) for r in rows]
+    conn.close()
+    if session_id:
+        rows = [
+            r for r in rows
+            if json.loads(r['bot_parms'])['session_id'] == session_id
+        ]
+    return rows
+
+
+def responses_from_conversation(conversation):
+    """Return [(round, question_id, answer, reason)] of one conversation
+
+    A page can be answered more than once if botex had to ask again for a
+    valid answer; the last answer counts. The round increases when a
+    question that was already answered shows up on a later page. The
+    conversation of a bot that was restarted mid-session (see
+    resume_botex_session.py) begins at the page it continued on, so its
+    rounds are counted from there.
+    """
+    pages = []
+    for m in json.loads(conversation):
+        content = m['content']
+        if m['role'] == 'user' and any(s in content for s in NEW_PAGE_MARKERS):
+            pages.append({})
+        elif m['role'] == 'assistant' and pages:
+            try:
+                answer = json.loads(content)
+            except ValueError:
+                continue
+            if isinstance(answer, dict) and answer.get('questions'):
+                pages[-1] = {
+                    q['id']: (q.get('answer'), q.get('reason'))
+                    for q in answer['questions'] if 'id' in q
+                }
+    responses = []
+    round, answered = 1, set()
+    for page in pages:
+        if answered & page.keys():
+            round += 1
+            answered = set()
+        answered |= page.keys()
+        responses += [
+            (round, qid, answer, reason)
+            for qid, (answer, reason) in page.items()
+        ]
+    return responses
+
+
+def read_responses_from_botex_db(session_id=None, botex_db=None, ids=None):
+    """Read the answers and reasons of all bots as a list of dicts
+
+    Each dict has the keys session_id, participant_id, round, question_id,
+    answer and reason. If ids is given, only the conversations with these
+    ids are read.
+    """
+    responses = []
+    for c in read_conversations_from_botex_db(session_id, botex_db, ids):
+        sid = json.loads(c['bot_parms'])['session_id']
+        responses += [
+            {
+                'session_id': sid, 'participant_id': c['id'], 'round': round,
+                'question_id': qid, 'answer': answer, 'reason': reason
+            }
+            for round, qid, answer, reason in responses_from_conversation(
+                c['conversation']
+            )
+        ]
+    return responses
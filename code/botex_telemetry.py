@@ -0,0 +1,216 @@
+import glob
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import litellm
+
+from botex_db_writer import BotexDBWriter
+
+# Records every LLM call that botex makes (through litellm) in the table
+# llm_calls of the botex database: model, prompt/completion/cached tokens,
+# latency, cost and the oTree page the call was made for.
+#
+# Usage:
+#   import botex_telemetry
+#   botex_telemetry.install(botex_db)
+#   botex.run_bots_on_session(
+#       ..., **botex_telemetry.tag("mftrust", session['session_id'])
+#   )
+#   botex_telemetry.uninstall()  # writes all pending rows
+#
+# tag() adds litellm metadata that botex passes on with every LLM call of
+# these bots, so each call carries its own session name and id. Bots run in
+# threads started by botex and litellm runs its callbacks in threads of its
+# own, so a context set by the caller (global, thread-local or ContextVar)
+# would not reach them. Calls without a tag are recorded without a session.
+# install() and uninstall() can be called by several runs at once; the
+# rows are written until the last run has called uninstall().
+#
+# The page and the retry count are derived from the botex prompts: each page
+# prompt contains the scraped body text of the page, which starts with the
+# page title, and every further user message for the same page is a retry.
+# Titles are matched against the {{ block title }} of the oTree templates,
+# because the scraped text does not always have a line break after the
+# title. The call for the closing remarks of a bot gets its own page.
+
+OTREE_DIR = 'otree'
+PAGE_PROMPT = re.compile(
+    r"This is the body text of the (?:entry page of (?:the|your) "
+    r"survey(?:/| or )experiment|web page):(.*)",
+    re.DOTALL
+)
+CLOSING_PROMPT = "This concludes the survey/experiment"
+CLOSING_PAGE = "(closing remarks)"
+TEMPLATE_TITLE = re.compile(r"{{ *block title *}}(.*?){{ *endblock *}}")
+
+METADATA_KEY = 'botex_telemetry'
+
+_writer = None
+_botex_db = None
+_installs = 0
+_lock = threading.Lock()
+_titles = None
+
+
+def create_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            session_name varchar, session_id char(8), page text,
+            model varchar, status varchar, prompt_tokens integer,
+            completion_tokens integer, cached_tokens integer,
+            latency real, retries integer, cost real,
+            time_start varchar, time_end varchar, error text
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS llm_calls_session "
+        "ON llm_calls (session_name, session_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS llm_calls_page_model "
+        "ON llm_calls (page, model)"
+    )
+
+
+def page_titles(otree_dir=OTREE_DIR):
+    """Return the page titles of the oTree templates, longest first"""
+    global _titles
+    if _titles is None:
+        titles = set()
+        for path in glob.glob(os.path.join(otree_dir, '*', '*.html')):
+            with open(path) as f:
+                titles.update(
+                    t.strip() for t in TEMPLATE_TITLE.findall(f.read())
+                )
+        _titles = sorted(titles, key=len, reverse=True)
+    return _titles
+
+
+def page_title(body):
+    """Return the title at the start of the scraped body text of a page"""
+    body = body.replace('\\n', '\n').strip()
+    for title in page_titles():
+        if body.startswith(title):
+            return title
+    return body.split('\n', 1)[0][:40]
+
+
+def page_and_retries(messages):
+    """Return the page title and the retry count of a botex prompt"""
+    retries = 0
+    for m in reversed(messages or []):
+        if m.get('role') != 'user' or not isinstance(m.get('content'), str):
+            continue
+        match = PAGE_PROMPT.search(m['content'])
+        if match:
+            return page_title(match.group(1)), retries
+        if CLOSING_PROMPT in m['content']:
+            return CLOSING_PAGE, retries
+        retries += 1
+    return None, 0
+
+
+def _usage(response):
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return None, None, None
+    # OpenAI style usage reports prompt_tokens_details.cached_tokens,
+    # Anthropic style usage cache_read_input_tokens
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', None) if details else None
+    if cached is None:
+        cached = getattr(usage, 'cache_read_input_tokens', None)
+    return usage.prompt_tokens, usage.completion_tokens, cached
+
+
+def tag(session_name=None, session_id=None):
+    """Keyword arguments for botex that tag the LLM calls of its bots"""
+    return {'metadata': {METADATA_KEY: {
+        'session_name': session_name, 'session_id': session_id
+    }}}
+
+
+def _context(kwargs):
+    metadata = (
+        (kwargs.get('litellm_params') or {}).get('metadata')
+        or kwargs.get('metadata') or {}
+    )
+    return metadata.get(METADATA_KEY) or {}
+
+
+def _log_call(kwargs, response, start_time, end_time, error=None):
+    if _writer is None:
+        return
+    try:
+        context = _context(kwargs)
+        page, retries = page_and_retries(kwargs.get('messages'))
+        prompt_tokens, completion_tokens, cached = (
+            _usage(response) if error is None else (None, None, None)
+        )
+        _writer.submit(
+            "INSERT INTO llm_calls VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                context.get('session_name'), context.get('session_id'),
+                page, kwargs.get('model'),
+                'ok' if error is None else 'error',
+                prompt_tokens, completion_tokens, cached,
+                (end_time - start_time).total_seconds(), retries,
+                kwargs.get('response_cost'),
+                start_time.isoformat(), end_time.isoformat(), error
+            )
+        )
+    except Exception:
+        logging.exception("Failed to record LLM call telemetry")
+
+
+def _on_success(kwargs, response, start_time, end_time):
+    _log_call(kwargs, response, start_time, end_time)
+
+
+def _on_failure(kwargs, response, start_time, end_time):
+    error = kwargs.get('exception') or kwargs.get('traceback_exception')
+    _log_call(kwargs, response, start_time, end_time, error=str(error))
+
+
+def install(botex_db):
+    """Start recording all litellm calls into the botex database
+
+    Raises RuntimeError if recording into another database is installed.
+    """
+    global _writer, _botex_db, _installs
+    with _lock:
+        if _writer is None:
+            conn = sqlite3.connect(botex_db, timeout=30)
+            with conn:
+                create_table(conn)
+            conn.close()
+            _writer = BotexDBWriter(botex_db)
+            _botex_db = os.path.abspath(botex_db)
+            litellm.success_callback.append(_on_success)
+            litellm.failure_callback.append(_on_failure)
+        elif os.path.abspath(botex_db) != _botex_db:
+            raise RuntimeError(
+                f"Telemetry is already recorded into {_botex_db}, "
+                f"not into {botex_db}"
+            )
+        _installs += 1
+
+
+def uninstall():
+    """Stop recording when the last run is done, write pending rows"""
+    global _writer, _botex_db, _installs
+    with _lock:
+        if _writer is None:
+            return
+        _installs -= 1
+        if _installs > 0:
+            return
+        litellm.success_callback.remove(_on_success)
+        litellm.failure_callback.remove(_on_failure)
+        _writer.close()
+        _writer = None
+        _botex_db = None
@@ -0,0 +1,154 @@
+import re
+import threading
+import weakref
+from array import array
+
+# Compact in-memory conversation history for runners that host many bots in
+# one process. A list of {'role': ..., 'content': ...} dicts keeps a separate
+# copy of the system prompt and of every page text for each bot. Here,
+# message contents are split into paragraphs, and each distinct paragraph is
+# stored once in a string table that all conversations of the process share.
+# A conversation itself is an append-only buffer of integer ids.
+#
+#   with CompactConversation() as conv:    # closed when the bot is done
+#       conv.append('system', system_prompt)
+#       conv.append('user', page_prompt)
+#       litellm.completion(model=..., messages=conv.to_list())
+#       ...
+#
+# The string table counts how many conversations use each paragraph. Closing
+# a conversation releases its paragraphs, so a long-running runner only
+# keeps the texts of its current bots. A conversation that is not closed,
+# e.g. after an exception, releases them when it is garbage collected
+# (weakref.finalize). A runner can also pass its own StringTable and drop it together with
+# its bots.
+#
+# botex keeps the history of its bots internally, so this is meant for our
+# own runners. See code/benchmark_conversation_memory.py for the savings.
+
+PARAGRAPH_BREAK = re.compile(r'(\n{2,})')
+ROLES = ('system', 'user', 'assistant', 'tool')
+
+
+class StringTable:
+    """Interns strings and hands out integer ids for them
+
+    Every id is reference-counted. A string is dropped when the last
+    conversation that uses it is closed, and its id is reused.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._strings = []
+        self._refs = array('I')
+        self._free = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def acquire(self, s):
+        """Return the id of s and add a reference to it"""
+        with self._lock:
+            i = self._ids.get(s)
+            if i is None:
+                if self._free:
+                    i = self._free.pop()
+                    self._strings[i] = s
+                else:
+                    i = len(self._strings)
+                    self._strings.append(s)
+                    self._refs.append(0)
+                self._ids[s] = i
+            self._refs[i] += 1
+            return i
+
+    def release(self, ids):
+        """Remove one reference per id, drop strings no longer used"""
+        with self._lock:
+            for i in ids:
+                self._refs[i] -= 1
+                if self._refs[i] == 0:
+                    del self._ids[self._strings[i]]
+                    self._strings[i] = None
+                    self._free.append(i)
+
+    def get(self, i):
+        return self._strings[i]
+
+
+SHARED_TABLE = StringTable()
+
+
+class Message:
+    """A message read back from a CompactConversation"""
+    __slots__ = ('role', 'content')
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+    def to_dict(self):
+        return {'role': self.role, 'content': self.content}
+
+
+class CompactConversation:
+    """Append-only conversation history backed by a shared StringTable"""
+    __slots__ = (
+        '_table', '_roles', '_parts', '_ends', '_release', '__weakref__'
+    )
+
+    def __init__(self, messages=(), table=SHARED_TABLE):
+        self._table = table
+        self._reset()
+        for m in messages:
+            self.append(m['role'], m['content'])
+
+    def append(self, role, content):
+        self._roles.append(ROLES.index(role))
+        self._parts.extend(
+            self._table.acquire(p)
+            for p in PARAGRAPH_BREAK.split(content) if p
+        )
+        self._ends.append(len(self._parts))
+
+    def _reset(self):
+        self._roles = bytearray()       # index into ROLES per message
+        self._parts = array('I')        # string ids of all paragraphs
+        self._ends = array('I')         # end of each message in _parts
+        # Holds _parts, not self, and runs at most once
+        self._release = weakref.finalize(
+            self, self._table.release, self._parts
+        )
+
+    def close(self):
+        """Release the strings of this conversation and empty it"""
+        self._release()
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._roles)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("message index out of range")
+        start = self._ends[i - 1] if i else 0
+        return Message(ROLES[self._roles[i]], ''.join(
+            self._table.get(p) for p in self._parts[start:self._ends[i]]
+        ))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_list(self):
+        """Return the history as the list of dicts that litellm expects"""
+        return [m.to_dict() for m in self]
@@ -0,0 +1,362 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compact storage for bot conversations.
+#
+# Many text blocks in the conversations table are identical across
+# participants (system prompt, botex preamble, page texts), and within a
+# conversation botex repeats the running summary in every prompt. The
+# compact format splits messages into paragraphs. Paragraphs that occur in
+# more than one conversation are stored only once, keyed by their SHA-256
+# hash. The remaining paragraphs of a conversation are compressed together
+# with the list of paragraph references of its messages, so that the
+# repetitions within the conversation compress well. Compression
+# uses zstd (with a dictionary trained on the data) or, if the zstandard
+# package is not installed, zlib. zstandard is optional and not part of the
+# project dependencies; install it with "pip install zstandard" for smaller
+# stores. The codec is chosen when a store is created and kept for it.
+#
+#   python code/conversation_store.py compact botex.sqlite3 botex_compact.sqlite3
+#   python code/conversation_store.py verify botex.sqlite3 botex_compact.sqlite3
+#
+# Running compact again on an existing compact database adds the new
+# conversations, so several botex databases can be compacted into one
+# store. Participants are added or, if already present, updated. They are
+# keyed by participant_id and URL, because single bot runs all have the
+# participant_id 'unknown'.
+# read_conversations_from_botex_db() below works for both formats and
+# returns the same rows as botex.read_conversations_from_botex_db().
+
+ZSTD_LEVEL = 19
+ZLIB_LEVEL = 9
+DICT_SIZE = 112640
+IDS_PER_QUERY = 500
+# Paragraph breaks, either real or escaped newlines (older botex versions)
+PARAGRAPH_BREAK = re.compile(r'((?:\n|\\n){2,})')
+
+
+def _create_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS store_meta (key text PRIMARY KEY, value blob);
+        CREATE TABLE IF NOT EXISTS message_blocks (
+            id integer PRIMARY KEY, hash blob UNIQUE, data blob
+        );
+        CREATE TABLE IF NOT EXISTS compact_conversations (
+            id char(8) PRIMARY KEY, bot_parms text, data blob
+        );
+    """)
+
+
+class _Codec:
+    """Compresses and decompresses blocks"""
+
+    def __init__(self, name, zstd_dict=None):
+        self.name = name
+        if name == 'zstd':
+            if zstandard is None:
+                raise RuntimeError(
+                    "This store is zstd compressed. "
+                    "Please install the zstandard package."
+                )
+            d = zstandard.ZstdCompressionDict(zstd_dict) if zstd_dict else None
+            self._c = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=d)
+            self._d = zstandard.ZstdDecompressor(dict_data=d)
+
+    def compress(self, data):
+        if self.name == 'zstd':
+            return self._c.compress(data)
+        return zlib.compress(data, ZLIB_LEVEL)
+
+    def decompress(self, data):
+        if self.name == 'zstd':
+            return self._d.decompress(data)
+        return zlib.decompress(data)
+
+    @classmethod
+    def from_db(cls, conn):
+        meta = dict(conn.execute("SELECT key, value FROM store_meta"))
+        return cls(meta['codec'], meta.get('zstd_dict'))
+
+
+def is_compact(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'compact_conversations'"
+    ).fetchone() is not None
+
+
+def compact(botex_db, compact_db, train_dict=True):
+    """Write a compact copy of a botex database or add to an existing one"""
+    src = sqlite3.connect(botex_db)
+    convs = src.execute(
+        "SELECT id, bot_parms, conversation FROM conversations"
+    ).fetchall()
+    part_sql = src.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'participants'"
+    ).fetchone()[0]
+    participants = src.execute("SELECT * FROM participants").fetchall()
+    src.close()
+
+    dst = sqlite3.connect(compact_db)
+    _create_tables(dst)
+    known_convs = {r[0] for r in dst.execute(
+        "SELECT id FROM compact_conversations"
+    )}
+    shared_ids = dict(dst.execute("SELECT hash, id FROM message_blocks"))
+    next_id = max(shared_ids.values(), default=0) + 1
+
+    # Split all new conversations into paragraphs and count in how many
+    # conversations each paragraph occurs
+    split = []
+    occurrences = {}
+    for id, bot_parms, conversation in convs:
+        if id in known_convs:
+            continue
+        messages = [
+            (m, [
+                (t, hashlib.sha256(t.encode()).digest())
+                for t in PARAGRAPH_BREAK.split(m['content'])
+            ])
+            for m in json.loads(conversation)
+        ]
+        split.append((id, bot_parms, messages))
+        for h in {h for _, paras in messages for _, h in paras}:
+            occurrences[h] = occurrences.get(h, 0) + 1
+
+    # Shared paragraphs get a positive id, local ones a negative index
+    # into the compressed list of local paragraphs of the conversation
+    new_shared = {}
+    rows = []
+    for id, bot_parms, messages in split:
+        local, local_idx, skeleton = [], {}, []
+        for m, paras in messages:
+            refs = []
+            for text, h in paras:
+                if h in shared_ids or occurrences[h] > 1:
+                    if h not in shared_ids:
+                        shared_ids[h] = next_id
+                        new_shared[h] = (next_id, text.encode())
+                        next_id += 1
+                    refs.append(shared_ids[h])
+                else:
+                    if h not in local_idx:
+                        local_idx[h] = len(local)
+                        local.append(text)
+                    refs.append(-1 - local_idx[h])
+            skeleton.append(dict(m, content=refs))
+        rows.append((
+            id, bot_parms, json.dumps([skeleton, local]).encode()
+        ))
+
+    meta = dict(dst.execute("SELECT key, value FROM store_meta"))
+    if not meta:
+        meta = {'codec': 'zstd' if zstandard else 'zlib'}
+        if zstandard is None:
+            logging.warning(
+                "zstandard is not installed, compressing with zlib"
+            )
+        samples = [d for _, d in new_shared.values()] + [r[2] for r in rows]
+        # Dictionary training needs a reasonable number of samples
+        if zstandard and train_dict and len(samples) >= 100:
+            meta['zstd_dict'] = zstandard.train_dictionary(
+                DICT_SIZE, samples
+            ).as_bytes()
+    codec = _Codec(meta['codec'], meta.get('zstd_dict'))
+
+    with dst:
+        dst.executemany(
+            "INSERT OR IGNORE INTO store_meta VALUES (?, ?)", meta.items()
+        )
+        dst.execute(part_sql.replace(
+            "CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1
+        ))
+        # Keep one row per participant, the one added last
+        dst.execute(
+            "DELETE FROM participants WHERE rowid NOT IN ("
+            "SELECT max(rowid) FROM participants "
+            "GROUP BY participant_id, url)"
+        )
+        dst.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS participants_participant_url "
+            "ON participants (participant_id, url)"
+        )
+        if participants:
+            dst.executemany(
+                "INSERT OR REPLACE INTO participants VALUES "
+                f"({', '.join('?' * len(participants[0]))})",
+                participants
+            )
+        dst.executemany(
+            "INSERT INTO message_blocks VALUES (?, ?, ?)",
+            ((i, h, codec.compress(d)) for h, (i, d) in new_shared.items())
+        )
+        dst.executemany(
+            "INSERT INTO compact_conversations VALUES (?, ?, ?)",
+            ((id, bot_parms, codec.compress(d)) for id, bot_parms, d in rows)
+        )
+    dst.execute("VACUUM")
+    dst.close()
+    return {
+        'conversations': len(rows), 'new_shared_blocks': len(new_shared),
+        'codec': meta['codec'], 'size_before': os.path.getsize(botex_db),
+        'size_after': os.path.getsize(compact_db),
+    }
+
+
+def _block_reader(conn, codec):
+    cache = {}
+
+    def block(i):
+        if i not in cache:
+            data = conn.execute(
+                "SELECT data FROM message_blocks WHERE id = ?", (i,)
+            ).fetchone()[0]
+            cache[i] = codec.decompress(data).decode()
+        return cache[i]
+
+    return block
+
+
+def _expand(codec, block, data):
+    skeleton, local = json.loads(codec.decompress(data))
+    return [
+        dict(m, content=''.join(
+            block(i) if i > 0 else local[-1 - i] for i in m['content']
+        ))
+        for m in skeleton
+    ]
+
+
+def read_compact_conversation(conn, participant_id):
+    """Return the messages of one conversation in a compact database"""
+    row = conn.execute(
+        "SELECT data FROM compact_conversations WHERE id = ?",
+        (participant_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    codec = _Codec.from_db(conn)
+    return _expand(codec, _block_reader(conn, codec), row[0])
+
+
+def _select(conn, sql, ids):
+    if ids is None:
+        return conn.execute(sql).fetchall()
+    ids = list(ids)
+    rows = []
+    for i in range(0, len(ids), IDS_PER_QUERY):
+        chunk = ids[i:i + IDS_PER_QUERY]
+        rows += conn.execute(
+            f"{sql} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall()
+    return rows
+
+
+def read_conversations_from_botex_db(botex_db, session_id=None, ids=None):
+    """Read conversations from a plain or a compact botex database
+
+    Returns a list of dicts with the keys id, bot_parms and conversation
+    (a JSON string), like botex.read_conversations_from_botex_db(). If ids
+    is given, only the conversations with these ids are read.
+    """
+    conn = sqlite3.connect(botex_db)
+    if not is_compact(conn):
+        rows = _select(
+            conn, "SELECT id, bot_parms, conversation FROM conversations", ids
+        )
+    else:
+        codec = _Codec.from_db(conn)
+        block = _block_reader(conn, codec)
+        rows = [
+            (id, bot_parms, json.dumps(_expand(codec, block, data)))
+            for id, bot_parms, data in _select(
+                conn, "SELECT id, bot_parms, data FROM compact_conversations",
+                ids
+            )
+        ]
+    conn.close()
+    convs = [
+        {'id': id, 'bot_parms': bot_parms, 'conversation': conversation}
+        for id, bot_parms, conversation in rows
+    ]
+    if session_id:
+        convs = [
+            c for c in convs
+            if json.loads(c['bot_parms'])['session_id'] == session_id
+        ]
+    return convs
+
+
+def verify(botex_db, compact_db):
+    """Compare the conversations of a botex database with a compact store
+
+    Only the conversations of botex_db are checked, as the store can also
+    hold those of other databases. Returns (missing, differing): the ids
+    that are not in the store and those whose content differs.
+    """
+    orig = {
+        c['id']: c for c in read_conversations_from_botex_db(botex_db)
+    }
+    comp = {
+        c['id']: c for c in read_conversations_from_botex_db(
+            compact_db, ids=list(orig)
+        )
+    }
+    missing = [id for id in orig if id not in comp]
+    differing = [
+        id for id in orig
+        if id in comp and (
+            orig[id]['bot_parms'] != comp[id]['bot_parms']
+            or json.loads(orig[id]['conversation'])
+            != json.loads(comp[id]['conversation'])
+        )
+    ]
+    return missing, differing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Content-addressed, compressed conversation storage"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help in (
+            ('compact', "write a compact copy of a botex database"),
+            ('verify', "compare a compact copy with the original")):
+        p = sub.add_parser(name, help=help)
+        p.add_argument('botex_db')
+        p.add_argument('compact_db')
+    sub.choices['compact'].add_argument(
+        '--no-dict', action='store_true',
+        help="do not train a zstd dictionary"
+    )
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        stats = compact(
+            args.botex_db, args.compact_db, train_dict=not args.no_dict
+        )
+        print(
+            f"Added {stats['conversations']} conversation(s) with "
+            f"{stats['new_shared_blocks']} new shared block(s) "
+            f"({stats['codec']}): "
+            f"{stats['size_before']:,} -> {stats['size_after']:,} bytes "
+            f"({stats['size_before'] / stats['size_after']:.1f}x smaller)"
+        )
+    else:
+        missing, differing = verify(args.botex_db, args.compact_db)
+        if missing or differing:
+            raise SystemExit(
+                f"Missing conversations: {', '.join(missing) or 'none'}\n"
+                f"Differing conversations: {', '.join(differing) or 'none'}"
+            )
+        print("All conversations match.")
@@ -1,14 +1,17 @@
-import botex
+import botex_reader
 from tabulate import tabulate
 
 import json
 
+# This reads all conversations of the database. To inspect a single bot in a
+# large database, use code/view_botex_conversation.py instead.
+
 # Adjust this to where you stored the botex data 
 # BOTEX_DB = 'data/external/botex_single_exp.sqlite3'
 BOTEX_DB = 'botex.sqlite3'
 
 # Reading response data from botex database
-conv = botex.read_conversations_from_botex_db(
+conv = botex_reader.read_conversations_from_botex_db(
   botex_db = BOTEX_DB
 )
 
@@ -0,0 +1,294 @@
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import argparse
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import botex
+
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+# Runs bots of one or several oTree sessions on many worker processes,
+# possibly on different machines. The coordinator initializes the sessions
+# and puts the bot URLs into a job queue. Workers pull URLs from the queue,
+# run a bot on each of them and report the outcome back to the queue. All
+# workers write to the same (central) botex database.
+#
+# The queue is a SQLite database. For several nodes, put it (and the botex
+# database) on a shared file system with working file locks (e.g. NFSv4).
+# The queue uses SQLite's rollback journal and not WAL, because WAL needs
+# shared memory on one host and is not safe on network file systems. Do not
+# switch the botex database to WAL (botex_db_writer.enable_wal) either.
+#
+# Typical use:
+#   python code/distributed_botex.py coordinator mftrust 20
+#   python code/distributed_botex.py worker --concurrency 4   # on each node
+#   python code/distributed_botex.py status
+#
+# Or, to try it out locally with several worker processes:
+#   python code/distributed_botex.py local mftrust 4 --workers 4
+#
+# Participants that share a group wait for each other, so the workers
+# together need at least as many bot slots as there are players per group.
+#
+# Workers hold a lease on their running jobs and renew it every
+# HEARTBEAT_SECONDS. If a worker dies (node loss, OOM, ...), its lease
+# expires and the jobs are queued again for the next worker.
+
+QUEUE_DB = 'botex_queue.sqlite3'
+BOTEX_DB = os.environ.get('BOTEX_DB', 'botex.sqlite3')
+MAX_ATTEMPTS = 3
+IDLE_SECONDS_BEFORE_EXIT = 60
+POLL_SECONDS = 2
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+
+
+def now(seconds=0):
+    return (
+        datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    ).isoformat()
+
+
+def connect(queue_db=QUEUE_DB):
+    conn = sqlite3.connect(queue_db, timeout=30, isolation_level=None)
+    # Rollback journal, see the header (a database can be left in WAL)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_jobs (
+            url text PRIMARY KEY, session_name varchar, session_id char(8),
+            participant_id char(8), status varchar, worker varchar,
+            attempts integer, enqueued_at varchar, started_at varchar,
+            finished_at varchar, error text, lease_until varchar
+        )
+    """)
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(bot_jobs)")]
+    if 'lease_until' not in columns:
+        conn.execute("ALTER TABLE bot_jobs ADD COLUMN lease_until varchar")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS bot_jobs_status ON bot_jobs (status)"
+    )
+    return conn
+
+
+def enqueue_session(config_name, npart, queue_db=QUEUE_DB, **kwargs):
+    """Initialize an oTree session and put its bot URLs into the queue"""
+    session = botex.init_otree_session(
+        config_name=config_name, npart=npart, botex_db=BOTEX_DB, **kwargs
+    )
+    conn = connect(queue_db)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO bot_jobs VALUES
+            (?, ?, ?, ?, 'queued', NULL, 0, ?, NULL, NULL, NULL, NULL)
+            """,
+            [
+                (
+                    url, config_name, session['session_id'],
+                    url.rstrip('/').split('/')[-1], now()
+                )
+                for url in session['bot_urls']
+            ]
+        )
+    conn.close()
+    logging.info(
+        f"Enqueued {len(session['bot_urls'])} bot(s) of session "
+        f"{session['session_id']} ({config_name})"
+    )
+    return session
+
+
+def requeue_expired(conn):
+    """Queue running jobs again whose worker stopped renewing the lease"""
+    rows = conn.execute(
+        """
+        UPDATE bot_jobs
+        SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+            finished_at = ?, error = 'lease of ' || worker || ' expired'
+        WHERE status = 'running' AND lease_until < ?
+        RETURNING url, worker
+        """,
+        (MAX_ATTEMPTS, now(), now())
+    ).fetchall()
+    for url, worker in rows:
+        logging.warning(f"Lease of {worker} on {url} expired, requeued")
+    return len(rows)
+
+
+def renew_leases(conn, worker):
+    """Extend the lease on all running jobs of a worker"""
+    conn.execute(
+        "UPDATE bot_jobs SET lease_until = ? "
+        "WHERE status = 'running' AND worker = ?",
+        (now(LEASE_SECONDS), worker)
+    )
+
+
+def claim_job(conn, worker):
+    """Atomically take the oldest queued job, None if there is none"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        requeue_expired(conn)
+        row = conn.execute(
+            """
+            UPDATE bot_jobs
+            SET status = 'running', worker = ?, started_at = ?,
+                attempts = attempts + 1, lease_until = ?
+            WHERE url = (
+                SELECT url FROM bot_jobs WHERE status = 'queued'
+                ORDER BY rowid LIMIT 1
+            )
+            RETURNING url, session_name, session_id, participant_id, attempts
+            """,
+            (worker, now(), now(LEASE_SECONDS))
+        ).fetchone()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    keys = ('url', 'session_name', 'session_id', 'participant_id', 'attempts')
+    return dict(zip(keys, row), worker=worker)
+
+
+def report_job(conn, job, error=None):
+    """Mark a job done, or re-queue it on failure until MAX_ATTEMPTS
+
+    Jobs that were requeued after their lease expired are left alone.
+    """
+    if error is None:
+        status = 'done'
+    elif job['attempts'] < MAX_ATTEMPTS:
+        status = 'queued'
+    else:
+        status = 'failed'
+    conn.execute(
+        "UPDATE bot_jobs SET status = ?, finished_at = ?, error = ? "
+        "WHERE url = ? AND status = 'running' AND worker = ?",
+        (status, now(), error, job['url'], job['worker'])
+    )
+
+
+def run_job(job, **kwargs):
+    botex.run_single_bot(
+        url=job['url'], session_name=job['session_name'],
+        session_id=job['session_id'], participant_id=job['participant_id'],
+        botex_db=BOTEX_DB, **kwargs
+    )
+
+
+def worker(concurrency=1, queue_db=QUEUE_DB, **kwargs):
+    """Pull jobs from the queue and run bots until it stays empty"""
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    stopped = threading.Event()
+
+    def heartbeat():
+        conn = connect(queue_db)
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            # A failed renewal must not end the heartbeat, or the leases
+            # run out while the bots are still running
+            try:
+                renew_leases(conn, name)
+            except sqlite3.Error:
+                logging.exception(f"{name}: renewing the leases failed")
+        conn.close()
+
+    def slot():
+        conn = connect(queue_db)
+        idle_since = time.monotonic()
+        while time.monotonic() - idle_since < IDLE_SECONDS_BEFORE_EXIT:
+            job = claim_job(conn, name)
+            if job is None:
+                time.sleep(POLL_SECONDS)
+                continue
+            logging.info(f"{name}: running bot on {job['url']}")
+            try:
+                run_job(job, **kwargs)
+                report_job(conn, job)
+            except Exception as e:
+                logging.exception(f"{name}: bot on {job['url']} failed")
+                report_job(conn, job, error=repr(e))
+            idle_since = time.monotonic()
+        conn.close()
+
+    beat = threading.Thread(target=heartbeat, daemon=True)
+    beat.start()
+    threads = [threading.Thread(target=slot) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stopped.set()
+    beat.join()
+
+
+def status(queue_db=QUEUE_DB):
+    """Return the number of jobs by session and status"""
+    conn = connect(queue_db)
+    rows = conn.execute(
+        """
+        SELECT session_name, session_id, status, count(*) FROM bot_jobs
+        GROUP BY session_name, session_id, status
+        ORDER BY session_name, session_id, status
+        """
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def run_local(config_name, npart, workers, concurrency=1):
+    """Coordinator plus several local worker processes"""
+    enqueue_session(config_name, npart)
+    procs = [
+        subprocess.Popen([
+            sys.executable, __file__, 'worker',
+            '--concurrency', str(concurrency)
+        ])
+        for _ in range(workers)
+    ]
+    return [p.wait() for p in procs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Distributed bot execution with a shared job queue"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('coordinator', help="initialize a session, enqueue bots")
+    p.add_argument('config_name')
+    p.add_argument('npart', type=int)
+    p = sub.add_parser('worker', help="run bots from the queue")
+    p.add_argument('--concurrency', type=int, default=1)
+    p = sub.add_parser('local', help="coordinator plus local workers")
+    p.add_argument('config_name')
+    p.add_argument('npart', type=int)
+    p.add_argument('--workers', type=int, default=2)
+    p.add_argument('--concurrency', type=int, default=1)
+    sub.add_parser('status', help="show the state of the queue")
+    args = parser.parse_args()
+
+    if args.command == 'coordinator':
+        enqueue_session(args.config_name, args.npart)
+    elif args.command == 'worker':
+        worker(concurrency=args.concurrency)
+    elif args.command == 'local':
+        run_local(
+            args.config_name, args.npart, args.workers, args.concurrency
+        )
+    if args.command in ('local', 'status'):
+        from tabulate import tabulate
+        print(tabulate(
+            status(),
+            headers=["Session", "Session ID", "Status", "Bots"]
+        ))
@@ -1,10 +1,10 @@
-import botex
+import botex_reader
 from tabulate import tabulate
 
 # Adjust this to where you stored the botex data 
 # BOTEX_DB = 'data/external/botex_single_exp.sqlite3'
 BOTEX_DB = 'botex.sqlite3'
-part = botex.read_participants_from_botex_db(
+part = botex_reader.read_participants_from_botex_db(
   botex_db = BOTEX_DB
 )
 disp_part = [
@@ -1,11 +1,11 @@
-import botex
+import botex_reader
 from tabulate import tabulate
 
 # Adjust this to where you stored the botex data 
 # BOTEX_DB = 'data/external/botex_single_exp.sqlite3'
 BOTEX_DB = 'botex.sqlite3'  # Use the default otree database
 # Reading response data from botex database
-responses = botex.read_responses_from_botex_db(
+responses = botex_reader.read_responses_from_botex_db(
   botex_db = BOTEX_DB
 )
 print(tabulate(responses, headers="keys"))
\ No newline at end of file
@@ -0,0 +1,364 @@
+import argparse
+import bisect
+import json
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+import botex_reader
+import otree_form_schema
+
+# Live view of the numeric answers of a running batch. It tails the botex
+# database by rowid, so every poll only reads the conversations that were
+# written since the last one, and keeps running statistics for each
+# session_name x condition x question_id x round cell: count, mean and
+# standard deviation (Welford) and the 5%, 50% and 95% quantiles. The
+# quantiles are exact for the first EXACT_QUANTILES_UNTIL answers of a cell;
+# after that, P² sketches that start from these answers take over, so the
+# memory per cell stays bounded.
+#
+# The condition is the profile of custom system prompts (grief_support, see
+# run_grief_support.py) or, for stakeholder, the relevance and consensus
+# conditions shown to the bot. Answers to choice fields are recorded as
+# labels and mapped to their values with the choices of the oTree apps, as
+# in resample_stats.py.
+#
+#   python code/live_stats.py                 # table in the terminal
+#   python code/live_stats.py --serve         # http://127.0.0.1:8766
+#   python code/live_stats.py --once          # print once and exit
+#
+# botex stores a conversation when its bot is done, so bots show up in the
+# statistics when they finish. Compact databases (conversation_store.py) are
+# archives of finished batches and cannot be tailed; use
+# resample_stats.py for them.
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+OTREE_DIR = 'otree'
+HOST = '127.0.0.1'
+PORT = 8766
+REFRESH_SECONDS = 1
+QUANTILES = (0.05, 0.5, 0.95)
+# P² is unreliable for small samples, so the first answers are kept
+EXACT_QUANTILES_UNTIL = 100
+
+# Page texts that reveal the stakeholder conditions, one dict per
+# dimension. The first match of a dimension counts: the later Checks page
+# lists all conditions as answer options.
+CONDITION_TEXTS = (
+    {
+        'low power to influence': 'Low Stakeholder Relevance',
+        'high power to influence': 'High Stakeholder Relevance',
+    },
+    {
+        'negative consensus': 'Negative Stakeholder Consensus',
+        'positive consensus': 'Positive Stakeholder Consensus',
+    },
+)
+PROFILE = re.compile(r"(?s).*?You are (\w+), a")
+
+
+class Welford:
+    """Running count, mean and variance"""
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def sd(self):
+        return (self.m2 / (self.n - 1)) ** 0.5 if self.n > 1 else None
+
+
+class P2Quantile:
+    """P² estimate of one quantile (Jain and Chlamtac, 1985)"""
+    __slots__ = ('p', 'q', 'pos', 'want', 'step')
+
+    def __init__(self, p):
+        self.p = p
+        self.q = []                                   # marker heights
+        self.pos = [0, 1, 2, 3, 4]                    # marker positions
+        self.want = [0, 2 * p, 4 * p, 2 + 2 * p, 4]   # desired positions
+        self.step = [0, p / 2, p, (1 + p) / 2, 1]
+
+    @classmethod
+    def from_sorted(cls, values, p):
+        """Start with markers placed on a sorted sample (at least 5)"""
+        s = cls(p)
+        n = len(values)
+        s.want = [(n - 1) * f for f in s.step]
+        s.pos = [round(w) for w in s.want]
+        for i in range(1, 5):
+            s.pos[i] = max(s.pos[i], s.pos[i - 1] + 1)
+        for i in range(3, -1, -1):
+            s.pos[i] = min(s.pos[i], s.pos[i + 1] - 1)
+        s.q = [values[i] for i in s.pos]
+        return s
+
+    def add(self, x):
+        q, pos = self.q, self.pos
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.want[i] += self.step[i]
+        for i in (1, 2, 3):
+            d = self.want[i] - pos[i]
+            if (
+                d >= 1 and pos[i + 1] - pos[i] > 1
+                or d <= -1 and pos[i - 1] - pos[i] < -1
+            ):
+                d = 1 if d > 0 else -1
+                h = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i])
+                    / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1])
+                    / (pos[i] - pos[i - 1])
+                )
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = h
+                pos[i] += d
+
+    def value(self):
+        if not self.q:
+            return None
+        if len(self.q) < 5:
+            return self.q[round(self.p * (len(self.q) - 1))]
+        return self.q[2]
+
+
+def exact_quantile(values, p):
+    """Quantile of a sorted list with linear interpolation"""
+    h = (len(values) - 1) * p
+    i = int(h)
+    if i + 1 >= len(values):
+        return values[-1]
+    return values[i] + (h - i) * (values[i + 1] - values[i])
+
+
+class Cell:
+    __slots__ = ('moments', 'values', 'quantiles')
+
+    def __init__(self):
+        self.moments = Welford()
+        self.values = []          # sorted answers while the cell is small
+        self.quantiles = None     # P² sketches once it is large
+
+    def add(self, x):
+        self.moments.add(x)
+        if self.quantiles is not None:
+            for s in self.quantiles:
+                s.add(x)
+            return
+        bisect.insort(self.values, x)
+        if len(self.values) >= EXACT_QUANTILES_UNTIL:
+            self.quantiles = [
+                P2Quantile.from_sorted(self.values, p) for p in QUANTILES
+            ]
+            self.values = None
+
+    def quantile_values(self):
+        if self.quantiles is not None:
+            return [s.value() for s in self.quantiles]
+        if not self.values:
+            return [None] * len(QUANTILES)
+        return [exact_quantile(self.values, p) for p in QUANTILES]
+
+
+def condition(bot_parms, messages):
+    """Profile or stakeholder conditions of one bot, '' if there are none"""
+    prompts = json.loads(bot_parms).get('user_prompts') or {}
+    match = PROFILE.match(prompts.get('system', ''))
+    if match:
+        return match.group(1)
+    found = [None] * len(CONDITION_TEXTS)
+    for m in messages:
+        if m['role'] != 'user':
+            continue
+        for i, texts in enumerate(CONDITION_TEXTS):
+            if found[i] is None:
+                found[i] = next(
+                    (c for t, c in texts.items() if t in m['content']), None
+                )
+        if all(found):
+            break
+    return ' / '.join(c for c in found if c)
+
+
+class LiveStats:
+    """Incremental statistics over the responses in a botex database"""
+
+    def __init__(self, botex_db=BOTEX_DB, otree_dir=OTREE_DIR):
+        if botex_reader.is_compact_db(botex_db):
+            raise ValueError(
+                f"{botex_db} is a compact database written by "
+                "conversation_store.py, live_stats.py needs the botex "
+                "database of the running batch"
+            )
+        self.conn = sqlite3.connect(
+            f"file:{botex_db}?mode=ro", uri=True, check_same_thread=False
+        )
+        self.fields = otree_form_schema.session_fields(otree_dir)
+        self.cells = {}
+        self.session_names = {}
+        self.bots = 0
+        self._last_conversation = 0
+        self._last_participant = 0
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """Add the conversations written since the last poll"""
+        for rowid, session_id, session_name in self.conn.execute(
+            "SELECT rowid, session_id, session_name FROM participants "
+            "WHERE rowid > ? ORDER BY rowid", (self._last_participant,)
+        ):
+            self.session_names[session_id] = session_name
+            self._last_participant = rowid
+        rows = self.conn.execute(
+            "SELECT rowid, bot_parms, conversation FROM conversations "
+            "WHERE rowid > ? ORDER BY rowid", (self._last_conversation,)
+        ).fetchall()
+        with self._lock:
+            for rowid, bot_parms, conversation in rows:
+                self._add(bot_parms, conversation)
+                self._last_conversation = rowid
+        return len(rows)
+
+    def _add(self, bot_parms, conversation):
+        session_name = self.session_names.get(
+            json.loads(bot_parms)['session_id'], ''
+        )
+        cond = condition(bot_parms, json.loads(conversation))
+        for round, qid, answer, _ in botex_reader.responses_from_conversation(
+            conversation
+        ):
+            prop = self.fields.get(session_name, {}).get(
+                qid.removeprefix('id_'), {}
+            )
+            try:
+                x = float(otree_form_schema.choice_value(prop, answer))
+            except (TypeError, ValueError):
+                continue
+            key = (session_name, cond, qid, round)
+            if key not in self.cells:
+                self.cells[key] = Cell()
+            self.cells[key].add(x)
+        self.bots += 1
+
+    def snapshot(self):
+        """Return one dict per cell, sorted by cell"""
+        with self._lock:
+            return [
+                {
+                    'session_name': k[0], 'condition': k[1],
+                    'question_id': k[2], 'round': k[3],
+                    'n': c.moments.n, 'mean': c.moments.mean,
+                    'sd': c.moments.sd,
+                    **{
+                        f"q{round(p * 100):02d}": v
+                        for p, v in zip(QUANTILES, c.quantile_values())
+                    }
+                }
+                for k, c in sorted(self.cells.items())
+            ]
+
+
+def run_poller(stats, stop):
+    while not stop.is_set():
+        stats.poll()
+        stop.wait(REFRESH_SECONDS)
+
+
+def serve(stats, port=PORT):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/stats.json':
+                body = json.dumps(stats.snapshot()).encode()
+                content_type = 'application/json'
+            elif self.path == '/':
+                body = (
+                    f'<html><head><meta http-equiv="refresh" '
+                    f'content="{REFRESH_SECONDS}"><title>botex live stats'
+                    f'</title></head><body><p>{stats.bots} bots</p>'
+                    + tabulate(stats.snapshot(), headers='keys',
+                               tablefmt='html', floatfmt='.2f')
+                    + '</body></html>'
+                ).encode()
+                content_type = 'text/html'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    ThreadingHTTPServer((HOST, port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Live statistics of the responses of a running batch"
+    )
+    parser.add_argument('--db', default=BOTEX_DB)
+    parser.add_argument('--otree', default=OTREE_DIR, help="oTree project")
+    parser.add_argument('--serve', action='store_true', help="serve over HTTP")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--once', action='store_true', help="print and exit")
+    args = parser.parse_args()
+
+    try:
+        stats = LiveStats(args.db, args.otree)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.once:
+        stats.poll()
+        print(tabulate(stats.snapshot(), headers='keys', floatfmt='.2f'))
+    elif args.serve:
+        stop = threading.Event()
+        threading.Thread(
+            target=run_poller, args=(stats, stop), daemon=True
+        ).start()
+        print(f"Serving on http://{HOST}:{args.port}")
+        try:
+            serve(stats, args.port)
+        except KeyboardInterrupt:
+            stop.set()
+    else:
+        try:
+            while True:
+                stats.poll()
+                print("\033[2J\033[H", end='')
+                print(f"{stats.bots} bots, {time.strftime('%H:%M:%S')}")
+                print(tabulate(stats.snapshot(), headers='keys',
+                               floatfmt='.2f'))
+                time.sleep(REFRESH_SECONDS)
+        except KeyboardInterrupt:
+            pass
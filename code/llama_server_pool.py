@@ -0,0 +1,403 @@
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+# Runs several llama.cpp servers (llama-server) for one local GGUF model,
+# each pinned to its own set of CPU cores, behind a small load-balancing
+# proxy. Bots talk to the proxy as if it were a single llama.cpp server,
+# e.g. botex.run_bots_on_session(..., model="llamacpp",
+# api_base="http://localhost:8080").
+#
+# Calls of the same bot are sent to the same server, so that the server
+# can reuse the KV cache of the conversation so far (--cache-reuse, and
+# llama.cpp picks the slot with the most similar prompt). A bot is
+# recognized by its first messages, which stay the same on every call.
+# New bots go to the least busy server.
+#
+# The supervisor health-checks the servers and restarts crashed or hung
+# instances. The benchmark mode tries several servers x slots x threads
+# layouts and reports the expected completed bot sessions per hour. It
+# starts at most MAX_SERVERS servers per layout, and only as many as the
+# available memory holds: the model is memory-mapped and shared by all
+# servers, and each server needs its own KV cache for ctx-size tokens.
+#
+#   python code/llama_server_pool.py serve --servers 4 --slots 1
+#   python code/llama_server_pool.py benchmark
+#
+# The model and the server binary are read from secrets.env
+# (LOCAL_LLM_PATH, PATH_TO_LLAMA_SERVER, NUMBER_OF_LAYERS_TO_OFFLOAD_TO_GPU).
+
+PROXY_PORT = 8080
+BASE_PORT = 8081
+CONTEXT_PER_SLOT = 4096
+# KV cache per token with an f16 cache, about right for 7-8B models with
+# grouped-query attention; larger models need more
+KV_BYTES_PER_TOKEN = 128 * 1024
+SERVER_OVERHEAD_BYTES = 512 * 1024 ** 2
+MAX_SERVERS = 16
+CACHE_REUSE_TOKENS = 256
+HEALTH_CHECK_SECONDS = 5
+STARTUP_TIMEOUT_SECONDS = 300
+# The system prompt and the start prompt are shared by many bots; the first
+# answer of the model makes the prefix specific to one bot
+ROUTING_PREFIX_MESSAGES = 3
+MAX_ROUTES = 10000
+BOTEX_DB = 'botex.sqlite3'
+
+
+class LlamaServer:
+    """One llama-server process pinned to a set of CPU cores"""
+
+    def __init__(self, port, cores, slots):
+        self.port = port
+        self.cores = cores
+        self.slots = slots
+        self.proc = None
+        self.in_flight = 0
+        self.restarts = 0
+        self.ready = False
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        cmd = [
+            os.environ.get('PATH_TO_LLAMA_SERVER', 'llama-server'),
+            '--model', os.environ['LOCAL_LLM_PATH'],
+            '--port', str(self.port),
+            '--threads', str(len(self.cores)),
+            '--parallel', str(self.slots),
+            '--ctx-size', str(CONTEXT_PER_SLOT * self.slots),
+            '--n-gpu-layers',
+            os.environ.get('NUMBER_OF_LAYERS_TO_OFFLOAD_TO_GPU', '0'),
+            # Reuse the KV cache of a shared prompt prefix (system prompt,
+            # botex preamble) instead of evaluating it again on every call
+            '--cache-reuse', str(CACHE_REUSE_TOKENS),
+        ]
+        self.proc = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(self.proc.pid, self.cores)
+        logging.info(
+            f"Started llama-server on port {self.port} "
+            f"(cores {self.cores}, {self.slots} slot(s))"
+        )
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    def healthy(self):
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=2) as r:
+                return r.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+
+class LlamaServerPool:
+    """Supervised llama-servers behind a sticky load-balancing proxy"""
+
+    def __init__(
+            self, servers, slots=1, threads=None, base_port=BASE_PORT,
+            proxy_port=PROXY_PORT
+        ):
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(
+            os, 'sched_getaffinity') else list(range(os.cpu_count()))
+        threads = threads or max(1, len(cores) // servers)
+        if servers * threads > len(cores):
+            raise ValueError(
+                f"{servers} server(s) x {threads} thread(s) exceed the "
+                f"{len(cores)} available cores"
+            )
+        self.servers = [
+            LlamaServer(
+                base_port + i, cores[i * threads:(i + 1) * threads], slots
+            )
+            for i in range(servers)
+        ]
+        self.proxy_port = proxy_port
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._proxy = None
+        self._routes = OrderedDict()    # prompt prefix hash -> server
+
+    def start(self):
+        for s in self.servers:
+            s.start()
+        self.wait_until_healthy()
+        threading.Thread(target=self._supervise, daemon=True).start()
+        self._proxy = ThreadingHTTPServer(
+            ('127.0.0.1', self.proxy_port), self._handler()
+        )
+        threading.Thread(target=self._proxy.serve_forever, daemon=True).start()
+        logging.info(f"Proxy listening on http://127.0.0.1:{self.proxy_port}")
+
+    def stop(self):
+        self._stop.set()
+        if self._proxy:
+            self._proxy.shutdown()
+            self._proxy.server_close()
+        for s in self.servers:
+            s.stop()
+
+    def wait_until_healthy(self, servers=None):
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        for s in servers or self.servers:
+            while not s.healthy():
+                if s.proc.poll() is not None:
+                    raise RuntimeError(f"llama-server on {s.port} exited")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"llama-server on {s.port} not ready")
+                time.sleep(1)
+            s.ready = True
+
+    def _supervise(self):
+        while not self._stop.wait(HEALTH_CHECK_SECONDS):
+            for s in self.servers:
+                crashed = s.proc.poll() is not None
+                # A busy server may be too slow to answer the health check
+                if crashed or (s.in_flight == 0 and not s.healthy()):
+                    logging.warning(f"Restarting llama-server on {s.port}")
+                    s.ready = False
+                    s.stop()
+                    s.start()
+                    s.restarts += 1
+                    try:
+                        self.wait_until_healthy([s])
+                    except (RuntimeError, TimeoutError):
+                        logging.exception(f"Restart on {s.port} failed")
+
+    def acquire(self, key=None):
+        """Return the server for a prompt prefix key
+
+        Calls with the same key go to the same server as long as it is
+        ready. Other calls go to the server with the fewest requests in
+        flight.
+        """
+        with self._lock:
+            s = self._routes.get(key) if key else None
+            if s is None or not s.ready:
+                ready = [s for s in self.servers if s.ready] or self.servers
+                s = min(ready, key=lambda s: s.in_flight / s.slots)
+            if key:
+                self._routes[key] = s
+                self._routes.move_to_end(key)
+                if len(self._routes) > MAX_ROUTES:
+                    self._routes.popitem(last=False)
+            s.in_flight += 1
+            return s
+
+    def release(self, server):
+        with self._lock:
+            server.in_flight -= 1
+
+    def _handler(self):
+        pool = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _forward(self, body=None):
+                server = pool.acquire(routing_key(body))
+                try:
+                    req = urllib.request.Request(
+                        server.url + self.path, data=body,
+                        method=self.command,
+                        headers={'Content-Type': 'application/json'}
+                    )
+                    try:
+                        with urllib.request.urlopen(req) as r:
+                            status, payload = r.status, r.read()
+                    except urllib.error.HTTPError as e:
+                        status, payload = e.code, e.read()
+                    except (urllib.error.URLError, OSError) as e:
+                        status, payload = 502, json.dumps(
+                            {'error': str(e)}).encode()
+                finally:
+                    pool.release(server)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._forward()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self._forward(self.rfile.read(length))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def routing_key(body):
+    """Hash of the first messages of a chat request, None if too short"""
+    try:
+        messages = json.loads(body)['messages']
+    except (TypeError, ValueError, KeyError):
+        return None
+    if not isinstance(messages, list) or \
+            len(messages) < ROUTING_PREFIX_MESSAGES:
+        return None
+    prefix = json.dumps(messages[:ROUTING_PREFIX_MESSAGES], sort_keys=True)
+    return hashlib.sha1(prefix.encode()).hexdigest()
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def bot_prompts(botex_db=BOTEX_DB):
+    """Return the message lists of stored bot calls and calls per session"""
+    conn = sqlite3.connect(botex_db)
+    convs = [json.loads(c) for (c,) in conn.execute(
+        "SELECT conversation FROM conversations"
+    )]
+    bots_per_session = conn.execute(
+        "SELECT avg(n) FROM (SELECT count(*) AS n FROM participants "
+        "WHERE is_human = 0 GROUP BY session_id)"
+    ).fetchone()[0] or 1
+    conn.close()
+    prompts = [
+        conv[:i + 1] for conv in convs
+        for i, m in enumerate(conv) if m['role'] == 'user'
+    ]
+    calls_per_bot = len(prompts) / max(1, len(convs))
+    return prompts, calls_per_bot * bots_per_session
+
+
+def benchmark_layout(servers, slots, threads, prompts, max_tokens=256):
+    """Return completed LLM calls per hour for one pool layout"""
+    pool = LlamaServerPool(servers, slots, threads)
+    pool.start()
+    try:
+        def call(messages):
+            body = json.dumps({
+                'messages': messages, 'max_tokens': max_tokens,
+                'temperature': 0, 'cache_prompt': True
+            }).encode()
+            req = urllib.request.Request(
+                f"http://127.0.0.1:{pool.proxy_port}/v1/chat/completions",
+                data=body, headers={'Content-Type': 'application/json'}
+            )
+            with urllib.request.urlopen(req) as r:
+                r.read()
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(servers * slots) as ex:
+            list(ex.map(call, prompts))
+        return 3600 * len(prompts) / (time.monotonic() - start)
+    finally:
+        pool.stop()
+
+
+def available_memory():
+    """Return the available memory in bytes, None if unknown"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def max_servers(slots):
+    """Return how many servers with this many slots fit into memory"""
+    memory = available_memory()
+    if memory is None:
+        return MAX_SERVERS
+    memory -= os.path.getsize(os.environ['LOCAL_LLM_PATH'])
+    per_server = (
+        KV_BYTES_PER_TOKEN * CONTEXT_PER_SLOT * slots + SERVER_OVERHEAD_BYTES
+    )
+    return max(0, min(MAX_SERVERS, memory // per_server))
+
+
+def benchmark(n_prompts=32):
+    prompts, calls_per_session = bot_prompts()
+    prompts = (prompts * (n_prompts // max(1, len(prompts)) + 1))[:n_prompts]
+    cores = len(os.sched_getaffinity(0)) if hasattr(
+        os, 'sched_getaffinity') else os.cpu_count()
+    results = []
+    for threads in (t for t in (1, 2, 4, 8, 16) if t <= cores):
+        for slots in (1, 2, 4):
+            servers = min(cores // threads, max_servers(slots))
+            if servers == 0:
+                logging.warning(
+                    f"Not enough memory for a server with {slots} slot(s)"
+                )
+                continue
+            calls_per_hour = benchmark_layout(
+                servers, slots, threads, prompts
+            )
+            results.append((
+                servers, slots, threads, calls_per_hour,
+                calls_per_hour / calls_per_session
+            ))
+            logging.info(f"Benchmarked {results[-1]}")
+    results.sort(key=lambda r: r[-1], reverse=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Supervised pool of local llama.cpp servers"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('serve', help="run the pool until interrupted")
+    p.add_argument('--servers', type=int, default=2)
+    p.add_argument('--slots', type=int, default=1)
+    p.add_argument('--threads', type=int, default=None)
+    p = sub.add_parser('benchmark', help="find the best pool layout")
+    p.add_argument('--prompts', type=int, default=32)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        pool = LlamaServerPool(args.servers, args.slots, args.threads)
+        pool.start()
+        try:
+            while True:
+                time.sleep(60)
+                logging.info(
+                    "In flight: " + ", ".join(
+                        f"{s.port}: {s.in_flight}" for s in pool.servers
+                    )
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.stop()
+    else:
+        from tabulate import tabulate
+        print(tabulate(
+            benchmark(args.prompts),
+            headers=[
+                "Servers", "Slots", "Threads", "Calls/hour", "Sessions/hour"
+            ],
+            floatfmt=".1f"
+        ))
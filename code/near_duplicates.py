@@ -0,0 +1,236 @@
+import argparse
+import json
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from tabulate import tabulate
+
+import botex_reader
+
+# Finds near-identical free-text answers across bots, e.g. to detect mode
+# collapse in the manager messages of mftrust, the messages of grief_support
+# or the justifications of stakeholder.
+#
+# Every text gets a MinHash signature over its word 3-grams. Signatures are
+# split into bands and stored with the hash of every band (LSH), so texts
+# only become candidates if they agree on a whole band. Candidates are
+# checked with the estimated Jaccard similarity and joined into clusters.
+# Nothing is compared pairwise, so this scales to millions of texts.
+#
+# Signatures and bands are stored in the botex database. Indexing only adds
+# the participants that are not indexed yet, like botex_fts.py.
+#
+#   python code/near_duplicates.py index
+#   python code/near_duplicates.py report [--threshold 0.7] [--examples 3]
+#
+# The report lists, for every session_name x model x question_id, how many
+# texts are in a cluster of near-duplicates and the largest clusters.
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+TEXT_QUESTIONS = (
+    'id_message', 'id_initial_message', 'id_response_message',
+    'id_final_message', 'id_justifications',
+)
+SHINGLE_WORDS = 3
+BANDS = 16
+ROWS = 8            # BANDS x ROWS hash functions, detection from ~0.7
+THRESHOLD = 0.7
+PRIME = (1 << 31) - 1
+SEED = 266
+PREVIEW_CHARS = 120
+
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(1, PRIME, BANDS * ROWS, dtype=np.uint64)
+_B = _rng.integers(0, PRIME, BANDS * ROWS, dtype=np.uint64)
+WORD = re.compile(r'\w+')
+
+
+def signature(text):
+    """MinHash signature (uint32 array) of the word shingles of text"""
+    words = WORD.findall(text.lower())
+    shingles = {
+        ' '.join(words[i:i + SHINGLE_WORDS])
+        for i in range(max(1, len(words) - SHINGLE_WORDS + 1))
+    }
+    h = np.fromiter(
+        (zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64,
+        count=len(shingles)
+    )
+    return ((_A[:, None] * h[None, :] + _B[:, None]) % PRIME).min(axis=1) \
+        .astype(np.uint32)
+
+
+def band_hashes(sig):
+    return [
+        zlib.crc32(sig[b * ROWS:(b + 1) * ROWS].tobytes())
+        for b in range(BANDS)
+    ]
+
+
+def create_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS minhash_texts (
+            id integer PRIMARY KEY, session_name varchar, model varchar,
+            participant_id char(8), round integer, question_id varchar,
+            preview text, signature blob
+        );
+        CREATE TABLE IF NOT EXISTS minhash_bands (
+            band integer, hash integer, text_id integer
+        );
+        CREATE INDEX IF NOT EXISTS minhash_bands_hash
+            ON minhash_bands (band, hash);
+        CREATE TABLE IF NOT EXISTS minhash_participants (
+            participant_id char(8) PRIMARY KEY
+        );
+    """)
+
+
+def update_index(botex_db=BOTEX_DB, questions=TEXT_QUESTIONS):
+    """Add the texts of all participants that are not indexed yet"""
+    conn = sqlite3.connect(botex_db, timeout=30)
+    create_tables(conn)
+    indexed = {r[0] for r in conn.execute(
+        "SELECT participant_id FROM minhash_participants"
+    )}
+    session_names = dict(conn.execute(
+        "SELECT DISTINCT session_id, session_name FROM participants"
+    ))
+    # Read through botex_reader, which also handles compact databases. Only
+    # the conversations in new are marked as indexed, see botex_fts.py.
+    new = [
+        id for id in botex_reader.read_conversation_ids(botex_db)
+        if id not in indexed
+    ]
+    added = 0
+    with conn:
+        for c in botex_reader.read_conversations_from_botex_db(
+            botex_db=botex_db, ids=new
+        ):
+            participant_id, conversation = c['id'], c['conversation']
+            parms = json.loads(c['bot_parms'])
+            for round, qid, answer, _ in \
+                    botex_reader.responses_from_conversation(conversation):
+                if qid not in questions or not isinstance(answer, str) \
+                        or not answer.strip():
+                    continue
+                sig = signature(answer)
+                text_id = conn.execute(
+                    "INSERT INTO minhash_texts VALUES "
+                    "(NULL, ?, ?, ?, ?, ?, ?, ?)", (
+                        session_names.get(parms['session_id'], ''),
+                        parms.get('model', ''), participant_id, round, qid,
+                        answer[:PREVIEW_CHARS], sig.tobytes()
+                    )
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO minhash_bands VALUES (?, ?, ?)",
+                    [(b, h, text_id) for b, h in enumerate(band_hashes(sig))]
+                )
+                added += 1
+            conn.execute(
+                "INSERT OR IGNORE INTO minhash_participants VALUES (?)",
+                (participant_id,)
+            )
+    conn.close()
+    return added
+
+
+def clusters(botex_db=BOTEX_DB, threshold=THRESHOLD):
+    """Return {(session_name, model, question_id): [[text ids], ...]}
+
+    Only texts of the same session_name, model and question are clustered.
+    """
+    conn = sqlite3.connect(botex_db)
+    texts = {
+        r[0]: (r[1], r[2], r[3], np.frombuffer(r[4], dtype=np.uint32))
+        for r in conn.execute(
+            "SELECT id, session_name, model, question_id, signature "
+            "FROM minhash_texts"
+        )
+    }
+    parent = {}
+    linked = set()
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    # Every bucket is checked against its first text only, so a bucket of n
+    # identical texts costs n comparisons, not n^2
+    for (members,) in conn.execute(
+        "SELECT group_concat(text_id) FROM minhash_bands "
+        "GROUP BY band, hash HAVING count(*) > 1"
+    ):
+        ids = [int(i) for i in members.split(',')]
+        first = texts[ids[0]]
+        for other in ids[1:]:
+            t = texts[other]
+            if t[:3] == first[:3] and np.mean(t[3] == first[3]) >= threshold:
+                a, b = find(ids[0]), find(other)
+                if a != b:
+                    parent[b] = a
+                linked.update((ids[0], other))
+    conn.close()
+    groups = defaultdict(lambda: defaultdict(list))
+    for text_id in linked:
+        groups[texts[text_id][:3]][find(text_id)].append(text_id)
+    result = {k: sorted(v.values(), key=len, reverse=True)
+              for k, v in groups.items()}
+    return result, texts
+
+
+def report(botex_db=BOTEX_DB, threshold=THRESHOLD):
+    found, texts = clusters(botex_db, threshold)
+    totals = defaultdict(int)
+    for t in texts.values():
+        totals[t[:3]] += 1
+    rows = []
+    for key, n in sorted(totals.items()):
+        cs = found.get(key, [])
+        dup = sum(len(c) for c in cs)
+        rows.append([
+            *key, n, len(cs), dup, dup / n, len(cs[0]) if cs else 0
+        ])
+    return rows, found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Near-duplicate bot texts with MinHash and LSH"
+    )
+    parser.add_argument('--db', default=BOTEX_DB)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('index', help="add new participants to the index")
+    p = sub.add_parser('report', help="report near-duplicate clusters")
+    p.add_argument('--threshold', type=float, default=THRESHOLD)
+    p.add_argument(
+        '--examples', type=int, default=0,
+        help="show this many of the largest clusters per cell"
+    )
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        print(f"Indexed {update_index(args.db)} new texts.")
+    else:
+        rows, found = report(args.db, args.threshold)
+        print(tabulate(rows, floatfmt='.2f', headers=[
+            'session_name', 'model', 'question_id', 'texts', 'clusters',
+            'in clusters', 'share', 'largest'
+        ]))
+        if args.examples:
+            conn = sqlite3.connect(args.db)
+            for key, cs in sorted(found.items()):
+                for c in cs[:args.examples]:
+                    preview = conn.execute(
+                        "SELECT preview FROM minhash_texts WHERE id = ?",
+                        (c[0],)
+                    ).fetchone()[0]
+                    print(f"\n{' / '.join(key)}: {len(c)} texts like")
+                    print(f"  {preview}")
+            conn.close()
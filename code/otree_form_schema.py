@@ -0,0 +1,284 @@
+import argparse
+import ast
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+# Generates a JSON schema for each form page of the oTree apps in this repo.
+#
+# The schema is derived from the Player/Group model fields (type, min, max,
+# choices, blank, label) and from form_model/form_fields (or the fields
+# returned by get_form_fields) of each page. The apps are parsed, not
+# imported, so this does not need oTree or a configured database.
+#
+# Bounds that oTree computes at runtime (e.g. sent_back_amount_max) are
+# added as "x-max-expression" so that a runner can bind them to the
+# current group values before validating.
+#
+# Usage: python code/otree_form_schema.py [otree_dir] [-o schemas.json]
+
+OTREE_DIR = 'otree'
+
+FIELD_TYPES = {
+    'BooleanField': 'boolean',
+    'CurrencyField': 'number',
+    'FloatField': 'number',
+    'IntegerField': 'integer',
+    'LongStringField': 'string',
+    'StringField': 'string',
+}
+
+
+def _eval(node, consts):
+    """Evaluate a constant expression from an app, None if not possible"""
+    env = {
+        '__builtins__': {}, 'range': range, 'str': str, 'int': int,
+        'cu': lambda x: x, 'C': consts,
+    }
+    try:
+        return eval(compile(ast.Expression(node), '<app>', 'eval'), env)
+    except Exception:
+        return None
+
+
+def _constants(tree):
+    consts = {}
+    for cls in tree.body:
+        if isinstance(cls, ast.ClassDef) and cls.name == 'C':
+            for stmt in cls.body:
+                if isinstance(stmt, ast.Assign):
+                    value = _eval(stmt.value, SimpleNamespace(**consts))
+                    for target in stmt.targets:
+                        consts[target.id] = value
+    return SimpleNamespace(**consts)
+
+
+def _field_schema(call, consts):
+    schema = {'type': FIELD_TYPES[call.func.attr]}
+    kwargs = {kw.arg: kw.value for kw in call.keywords}
+    if 'label' in kwargs:
+        schema['description'] = _eval(kwargs['label'], consts)
+    for key, bound in (('min', 'minimum'), ('max', 'maximum')):
+        if key in kwargs:
+            value = _eval(kwargs[key], consts)
+            if isinstance(value, (int, float)):
+                schema[bound] = value
+    if 'choices' in kwargs:
+        choices = _eval(kwargs['choices'], consts) or []
+        values = [c[0] if isinstance(c, (list, tuple)) else c for c in choices]
+        schema['enum'] = values
+        labels = [c[1] for c in choices if isinstance(c, (list, tuple))]
+        if labels and labels != [str(v) for v in values]:
+            schema['x-choice-labels'] = dict(zip(map(str, values), labels))
+    blank = 'blank' in kwargs and _eval(kwargs['blank'], consts)
+    return schema, not blank
+
+
+def _model_fields(tree, consts):
+    """Return {model: {field: (schema, required)}} for Player and Group"""
+    models = {}
+    for cls in tree.body:
+        if not isinstance(cls, ast.ClassDef) or cls.name not in (
+                'Player', 'Group'):
+            continue
+        fields = {}
+        for stmt in cls.body:
+            if (
+                isinstance(stmt, ast.Assign)
+                and isinstance(stmt.value, ast.Call)
+                and isinstance(stmt.value.func, ast.Attribute)
+                and stmt.value.func.attr in FIELD_TYPES
+            ):
+                fields[stmt.targets[0].id] = _field_schema(stmt.value, consts)
+        models[cls.name.lower()] = fields
+    return models
+
+
+def _dynamic_bounds(tree):
+    """Return {field: {'x-min-expression'|'x-max-expression': expr}}"""
+    bounds = {}
+    for func in tree.body:
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        for suffix, key in (('_min', 'x-min-expression'),
+                            ('_max', 'x-max-expression')):
+            if func.name.endswith(suffix):
+                ret = [s for s in func.body if isinstance(s, ast.Return)]
+                if ret:
+                    field = func.name[:-len(suffix)]
+                    bounds.setdefault(field, {})[key] = ast.unparse(
+                        ret[0].value
+                    )
+    return bounds
+
+
+def _page_fields(cls):
+    """Return (form_model, fields, dynamic) for a page class"""
+    form_model, fields, dynamic = None, [], False
+    for stmt in cls.body:
+        if isinstance(stmt, ast.Assign):
+            name = stmt.targets[0].id
+            if name == 'form_model':
+                form_model = stmt.value.value
+            elif name == 'form_fields':
+                fields = [e.value for e in stmt.value.elts]
+        elif (
+            isinstance(stmt, ast.FunctionDef)
+            and stmt.name == 'get_form_fields'
+        ):
+            dynamic = True
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Return) and isinstance(
+                        node.value, ast.List):
+                    for e in node.value.elts:
+                        if e.value not in fields:
+                            fields.append(e.value)
+    return form_model, fields, dynamic
+
+
+def app_schemas(app_path):
+    """Return {page_name: JSON schema} for all form pages of an app"""
+    with open(os.path.join(app_path, '__init__.py')) as f:
+        tree = ast.parse(f.read())
+    consts = _constants(tree)
+    models = _model_fields(tree, consts)
+    bounds = _dynamic_bounds(tree)
+    schemas = {}
+    for cls in tree.body:
+        if not isinstance(cls, ast.ClassDef):
+            continue
+        form_model, fields, dynamic = _page_fields(cls)
+        if not form_model or not fields:
+            continue
+        props, required = {}, []
+        for field in fields:
+            schema, req = models[form_model][field]
+            schema = dict(schema, **bounds.get(field, {}))
+            props[field] = schema
+            # Fields from get_form_fields() are not shown on every visit
+            if req and not dynamic:
+                required.append(field)
+        schemas[cls.name] = {
+            '$schema': 'https://json-schema.org/draft/2020-12/schema',
+            'title': f"{os.path.basename(app_path)}/{cls.name}",
+            'type': 'object',
+            'properties': props,
+            'required': required,
+            'additionalProperties': False,
+        }
+    return schemas
+
+
+def all_schemas(otree_dir=OTREE_DIR):
+    """Return {app: {page: schema}} for all apps in an oTree project"""
+    schemas = {}
+    for app in sorted(os.listdir(otree_dir)):
+        app_path = os.path.join(otree_dir, app)
+        if os.path.isfile(os.path.join(app_path, '__init__.py')):
+            schemas[app] = app_schemas(app_path)
+    return schemas
+
+
+def session_apps(otree_dir=OTREE_DIR):
+    """Return {session config name: app_sequence} from settings.py"""
+    with open(os.path.join(otree_dir, 'settings.py')) as f:
+        tree = ast.parse(f.read())
+    apps = {}
+    for stmt in tree.body:
+        if (
+            isinstance(stmt, ast.Assign)
+            and getattr(stmt.targets[0], 'id', None) == 'SESSION_CONFIGS'
+        ):
+            for config in stmt.value.elts:
+                kwargs = {kw.arg: kw.value for kw in config.keywords}
+                apps[_eval(kwargs['name'], None)] = _eval(
+                    kwargs['app_sequence'], None
+                )
+    return apps
+
+
+def session_fields(otree_dir=OTREE_DIR):
+    """Return {session config name: {field: schema}} of all form fields"""
+    schemas = all_schemas(otree_dir)
+    fields = {}
+    for name, apps in session_apps(otree_dir).items():
+        fields[name] = {}
+        for app in apps or []:
+            for page in schemas.get(app, {}).values():
+                fields[name].update(page['properties'])
+    return fields
+
+
+def choice_value(prop, value):
+    """Return the choice value for an answer given as the choice label
+
+    Botex records the answers to choice fields as the labels that the bot
+    saw ('Very', 'Investor'). Other answers are returned unchanged.
+    """
+    labels = prop.get('x-choice-labels', {})
+    if isinstance(value, str) and value not in labels:
+        for code, label in labels.items():
+            if value.strip().lower() == str(label).strip().lower():
+                return next(v for v in prop['enum'] if str(v) == code)
+    return value
+
+
+def validate_answers(schema, answers):
+    """Validate answers for one page against its schema
+
+    answers maps field names (or botex question ids like 'id_sent_amount')
+    to values. Answers to choice fields can be the value or its label.
+    Returns a list of error messages, empty if all is fine.
+    Runtime bounds (x-min-expression/x-max-expression) are not checked.
+    """
+    answers = {k.removeprefix('id_'): v for k, v in answers.items()}
+    props = schema['properties']
+    errors = [
+        f"{field}: answer missing" for field in schema['required']
+        if field not in answers
+    ]
+    for field, value in answers.items():
+        if field not in props:
+            errors.append(f"{field}: not a field of this page")
+            continue
+        prop = props[field]
+        value = choice_value(prop, value)
+        if prop['type'] in ('integer', 'number'):
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                if 'x-choice-labels' in prop:
+                    errors.append(
+                        f"{field}: {value!r} not in "
+                        f"{list(prop['x-choice-labels'].values())}"
+                    )
+                else:
+                    errors.append(f"{field}: {value!r} is not a number")
+                continue
+            if prop['type'] == 'integer' and not number.is_integer():
+                errors.append(f"{field}: {value!r} is not an integer")
+            if 'minimum' in prop and number < prop['minimum']:
+                errors.append(f"{field}: {value!r} < {prop['minimum']}")
+            if 'maximum' in prop and number > prop['maximum']:
+                errors.append(f"{field}: {value!r} > {prop['maximum']}")
+            value = number
+        if 'enum' in prop and value not in prop['enum']:
+            errors.append(f"{field}: {value!r} not in {prop['enum']}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="JSON schemas for the form pages of oTree apps"
+    )
+    parser.add_argument('otree_dir', nargs='?', default=OTREE_DIR)
+    parser.add_argument('-o', '--output', help="write schemas to this file")
+    args = parser.parse_args()
+    schemas = all_schemas(args.otree_dir)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(schemas, f, indent=2)
+    else:
+        json.dump(schemas, sys.stdout, indent=2)
+        print()
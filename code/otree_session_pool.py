@@ -0,0 +1,167 @@
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import argparse
+import ast
+import os
+import queue
+import threading
+import time
+
+import botex
+
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+# Keeps a pool of ready oTree sessions for each session config, so that
+# creating a session (oTree REST API, creating_session, treatment assignment)
+# is no longer on the critical path of a bot run. Background threads create
+# sessions ahead of demand and refill the pool whenever a session is taken.
+#
+#   pool = SessionPool({'mftrust': 2, 'stakeholder': 1}, size=3)
+#   pool.start()
+#   session = pool.get('mftrust')   # returns at once if the pool is warm
+#   botex.run_bots_on_session(session_id=session['session_id'])
+#   pool.stop()
+#   print(pool.metrics())
+#
+# Sessions that are still in the pool when it stops are never used. They
+# stay in oTree and in the botex database without any started participant.
+#
+# Usage: python code/otree_session_pool.py [--size 3] [--runs 5] [config ...]
+
+OTREE_SETTINGS = 'otree/settings.py'
+BOTEX_DB = os.environ.get('BOTEX_DB', 'botex.sqlite3')
+POOL_SIZE = 3
+CREATOR_THREADS = 2
+
+
+def session_configs(settings=OTREE_SETTINGS):
+    """Return {config name: num_demo_participants} from SESSION_CONFIGS"""
+    with open(settings) as f:
+        tree = ast.parse(f.read())
+    for stmt in tree.body:
+        if (
+            isinstance(stmt, ast.Assign)
+            and stmt.targets[0].id == 'SESSION_CONFIGS'
+        ):
+            configs = {}
+            for call in stmt.value.elts:
+                kw = {k.arg: ast.literal_eval(k.value) for k in call.keywords}
+                configs[kw['name']] = kw.get('num_demo_participants', 1)
+            return configs
+    return {}
+
+
+class SessionPool:
+    """Pool of pre-created oTree sessions per session config"""
+
+    def __init__(self, configs, size=POOL_SIZE, threads=CREATOR_THREADS):
+        self.configs = configs
+        self.size = size
+        self._ready = {name: queue.Queue() for name in configs}
+        self._requests = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._creator, daemon=True)
+            for _ in range(threads)
+        ]
+        self._latencies = []
+        self._hits = 0
+        self._misses = 0
+
+    def start(self):
+        for name in self.configs:
+            for _ in range(self.size):
+                self._requests.put(name)
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        for _ in self._threads:
+            self._requests.put(None)
+        for t in self._threads:
+            t.join()
+
+    def _create(self, name):
+        start = time.perf_counter()
+        session = botex.init_otree_session(
+            config_name=name, npart=self.configs[name], botex_db=BOTEX_DB
+        )
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return session
+
+    def _creator(self):
+        while not self._stop.is_set():
+            name = self._requests.get()
+            if name is None or self._stop.is_set():
+                return
+            try:
+                self._ready[name].put(self._create(name))
+            except Exception:
+                logging.exception(f"Creating a {name} session failed")
+                time.sleep(5)
+                self._requests.put(name)
+
+    def get(self, name):
+        """Take a ready session, create one right away if the pool is empty"""
+        try:
+            session = self._ready[name].get_nowait()
+            hit = True
+        except queue.Empty:
+            session = self._create(name)
+            hit = False
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+        # Refill the pool in the background. On a miss, the refills for the
+        # sessions taken earlier are still in the making.
+        if hit:
+            self._requests.put(name)
+        return session
+
+    def metrics(self):
+        with self._lock:
+            lat = sorted(self._latencies)
+            n, taken = len(lat), self._hits + self._misses
+            return {
+                'sessions_created': n,
+                'mean_creation_s': sum(lat) / n if n else None,
+                'p95_creation_s': lat[int(0.95 * (n - 1))] if n else None,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / taken if taken else None,
+                'ready': {k: q.qsize() for k, q in self._ready.items()},
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run bot sessions from a pool of pre-created sessions"
+    )
+    parser.add_argument('configs', nargs='*', help="default: all configs")
+    parser.add_argument('--size', type=int, default=POOL_SIZE)
+    parser.add_argument('--runs', type=int, default=1)
+    args = parser.parse_args()
+
+    configs = session_configs()
+    if args.configs:
+        configs = {k: configs[k] for k in args.configs}
+    pool = SessionPool(configs, size=args.size)
+    pool.start()
+    try:
+        for _ in range(args.runs):
+            for name in configs:
+                session = pool.get(name)
+                botex.run_bots_on_session(
+                    session_id=session['session_id'], botex_db=BOTEX_DB
+                )
+    finally:
+        pool.stop()
+    for key, value in pool.metrics().items():
+        print(f"{key}: {value}")
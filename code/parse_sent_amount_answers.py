@@ -1,10 +1,9 @@
-import botex
-from scipy import stats
+import botex_reader
 from tabulate import tabulate
 
 # BOTEX_DB = 'data/external/botex_session_exp.sqlite3'
 BOTEX_DB = 'botex.sqlite3'
-responses = botex.read_responses_from_botex_db(
+responses = botex_reader.read_responses_from_botex_db(
   botex_db = BOTEX_DB
 )
 sent_amount_first_round = [
@@ -12,6 +11,8 @@ sent_amount_first_round = [
       if r['question_id'] == "id_sent_amount" and r['round'] == 1
 ]
 print(tabulate({"Sent Amount": sent_amount_first_round}, headers = "keys"))
+# scipy is only imported once the data is read, it takes a while to load
+from scipy import stats
 t_stat, p_value = stats.ttest_1samp(sent_amount_first_round, 50)
 
 print("t statistic:", '{:.2f}'.format(t_stat))
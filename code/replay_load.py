@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict, deque
+from datetime import datetime
+from html.parser import HTMLParser
+
+from tabulate import tabulate
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+import botex_reader
+
+# Load generator for capacity tests of an oTree server. It replays bot runs
+# recorded in a botex database on fresh sessions of the same configs,
+# without any LLM: each simulated participant loads its pages and submits
+# the answers that the bot gave.
+#
+# Participants start with their recorded arrival offsets (time_in, relative
+# to the first participant of all replayed sessions) divided by the
+# speed-up factor. The database does not store when each page was
+# submitted, so the recorded time of a participant (time_out - time_in) is
+# spread evenly over its pages. Wait pages are polled by reloading them
+# every WAIT_POLL_SECONDS, whatever the speed-up, so that a high speed-up
+# does not add polling load that a real session would not have. Sessions
+# that were run on different days keep their distance too, so use --session
+# or the database of a single batch to replay one of them.
+#
+#   python code/replay_load.py --speedup 1 10 100
+#   python code/replay_load.py --session s7gca5qt --speedup 10 --repeat 20
+#
+# For every speed-up factor, the report lists the latency percentiles of all
+# requests, the share of failed requests and of rejected form submissions.
+# Use a fresh oTree server (otree devserver or prodserver) and not the one
+# of a real study.
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+OTREE_SERVER_URL = os.environ.get('OTREE_SERVER_URL', 'http://localhost:8000')
+OTREE_REST_KEY = os.environ.get('OTREE_REST_KEY')
+WAIT_POLL_SECONDS = 1
+MAX_REQUESTS_PER_PARTICIPANT = 500
+TIMEOUT_SECONDS = 60
+
+
+class FormParser(HTMLParser):
+    """Collects the fields of the first POST form of an oTree page
+
+    Choice fields also get the label text of each option, because botex
+    records the label that the bot chose.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.action = None
+        self.fields = {}      # name -> {'type', 'value', 'options', 'labels'}
+        self._in_form = False
+        self._select = None
+        self._radio_ids = {}  # input id -> (name, value)
+        self._label = None    # (name, value, text parts) of an open label
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == 'form' and a.get('method', '').lower() == 'post':
+            if self.action is None:
+                self.action = a.get('action') or ''
+                self._in_form = True
+        if not self._in_form:
+            return
+        if tag == 'label' and a.get('for') in self._radio_ids:
+            self._label = (*self._radio_ids[a['for']], [])
+        elif tag == 'option' and self._select and a.get('value'):
+            self.fields[self._select]['options'].append(a['value'])
+            self._label = (self._select, a['value'], [])
+        if not a.get('name'):
+            return
+        if tag == 'input':
+            f = self.fields.setdefault(a['name'], {
+                'type': a.get('type', 'text'), 'value': None, 'options': [],
+                'labels': {}, 'min': a.get('min')
+            })
+            if f['type'] in ('radio', 'checkbox'):
+                f['options'].append(a.get('value'))
+                if a.get('id'):
+                    self._radio_ids[a['id']] = (a['name'], a.get('value'))
+            else:
+                f['value'] = a.get('value')
+        elif tag in ('select', 'textarea'):
+            self.fields[a['name']] = {
+                'type': tag, 'value': None, 'options': [], 'labels': {},
+                'min': None
+            }
+            self._select = a['name'] if tag == 'select' else None
+
+    def handle_data(self, data):
+        if self._label:
+            self._label[2].append(data)
+
+    def handle_endtag(self, tag):
+        if tag in ('label', 'option') and self._label:
+            name, value, text = self._label
+            label = ' '.join(''.join(text).split()).lower()
+            self.fields[name]['labels'][label] = value
+            self._label = None
+        if tag == 'form':
+            self._in_form = False
+        elif tag == 'select':
+            self._select = None
+
+
+def create_session(config_name, npart, server=None):
+    """Create a session with the oTree REST API, return the start URLs"""
+    server = server or OTREE_SERVER_URL
+    headers = {
+        'otree-rest-key': OTREE_REST_KEY or '',
+        'Content-Type': 'application/json'
+    }
+    req = urllib.request.Request(
+        f"{server}/api/sessions", headers=headers,
+        data=json.dumps({
+            'session_config_name': config_name, 'num_participants': npart
+        }).encode()
+    )
+    with urllib.request.urlopen(req, timeout=TIMEOUT_SECONDS) as r:
+        code = json.loads(r.read())['code']
+    req = urllib.request.Request(
+        f"{server}/api/sessions/{code}", headers=headers
+    )
+    with urllib.request.urlopen(req, timeout=TIMEOUT_SECONDS) as r:
+        participants = json.loads(r.read())['participants']
+    participants.sort(key=lambda p: p['id_in_session'])
+    return [
+        f"{server}/InitializeParticipant/{p['code']}"
+        for p in participants
+    ]
+
+
+def recorded_sessions(botex_db=BOTEX_DB, session_id=None):
+    """Return [{config, participants: [{offset, page_time, answers}]}]
+
+    answers maps each form field to the recorded answers in round order.
+    """
+    parts = [
+        p for p in botex_reader.read_participants_from_botex_db(
+            session_id=session_id, botex_db=botex_db
+        )
+        # Single bot runs (session id 'unknown') have no session config
+        if not p['is_human'] and p['time_in'] and p['time_out']
+        and p['session_id'] != 'unknown'
+    ]
+    answers = defaultdict(lambda: defaultdict(deque))
+    for r in botex_reader.read_responses_from_botex_db(
+        session_id=session_id, botex_db=botex_db
+    ):
+        field = r['question_id'].removeprefix('id_')
+        answers[r['participant_id']][field].append(r['answer'])
+    pages = {}
+    for c in botex_reader.read_conversations_from_botex_db(
+        session_id=session_id, botex_db=botex_db
+    ):
+        pages[c['id']] = sum(
+            m['role'] == 'user' and any(
+                s in m['content'] for s in botex_reader.NEW_PAGE_MARKERS
+            )
+            for m in json.loads(c['conversation'])
+        )
+
+    sessions = defaultdict(list)
+    for p in parts:
+        sessions[(p['session_name'], p['session_id'])].append(p)
+    if not parts:
+        return []
+    # One start for all sessions keeps the offsets between sessions
+    start = min(datetime.fromisoformat(p['time_in']) for p in parts)
+    result = []
+    for (config, _), ps in sorted(sessions.items()):
+        result.append({'config': config, 'participants': [
+            {
+                'offset': (
+                    datetime.fromisoformat(p['time_in']) - start
+                ).total_seconds(),
+                'page_time': (
+                    datetime.fromisoformat(p['time_out'])
+                    - datetime.fromisoformat(p['time_in'])
+                ).total_seconds() / max(pages.get(p['participant_id'], 1), 1),
+                'answers': answers[p['participant_id']],
+            }
+            for p in ps
+        ]})
+    return result
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.submits = 0
+        self.rejected = 0
+        self.finished = 0
+        self.participants = 0
+        self.duration = None
+
+
+def _request(url, stats, data=None):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(
+            url, data=data, timeout=TIMEOUT_SECONDS
+        ) as r:
+            body = r.read().decode()
+            final_url = r.geturl()
+    except (urllib.error.URLError, OSError):
+        with stats.lock:
+            stats.errors += 1
+            stats.latencies.append(time.perf_counter() - start)
+        return None, None
+    with stats.lock:
+        stats.latencies.append(time.perf_counter() - start)
+    return final_url, body
+
+
+def form_data(form, answers):
+    """Encode the fields of a parsed form for submitting it
+
+    answers maps field names to deques of answers, the first one is used
+    and removed. Fields without an answer get a value that passes the
+    form validation.
+    """
+    data = {}
+    for name, f in form.fields.items():
+        value = None
+        if answers.get(name):
+            value = answers[name].popleft()
+        if value is not None and f['options']:
+            # Recorded answers of choice fields can be the value or the label
+            if str(value) not in f['options']:
+                value = f['labels'].get(' '.join(str(value).split()).lower())
+        if value is None:
+            if f['type'] == 'hidden' or f['value']:
+                value = f['value']
+            elif f['options']:
+                value = f['options'][0]
+            elif f['type'] == 'number':
+                value = f['min'] or 0
+            else:
+                value = 'n/a'
+        data[name] = str(value)
+    return urllib.parse.urlencode(data).encode()
+
+
+def replay_participant(url, recorded, speedup, stats, start_at):
+    time.sleep(max(0, start_at + recorded['offset'] / speedup - time.time()))
+    answers = {k: deque(v) for k, v in recorded['answers'].items()}
+    with stats.lock:
+        stats.participants += 1
+    for _ in range(MAX_REQUESTS_PER_PARTICIPANT):
+        page_url, body = _request(url, stats)
+        if body is None:
+            time.sleep(WAIT_POLL_SECONDS)
+            continue
+        if 'OutOfRangeNotification' in page_url:
+            with stats.lock:
+                stats.finished += 1
+            return
+        form = FormParser()
+        form.feed(body)
+        if form.action is None:
+            # Wait page: reload it until the group is complete
+            url = page_url
+            time.sleep(WAIT_POLL_SECONDS)
+            continue
+        time.sleep(recorded['page_time'] / speedup)
+        action = urllib.parse.urljoin(page_url, form.action)
+        next_url, _ = _request(action, stats, form_data(form, answers))
+        with stats.lock:
+            stats.submits += 1
+            if next_url == page_url:
+                stats.rejected += 1
+        url = next_url or page_url
+
+
+def replay(sessions, speedup, repeat=1):
+    """Replay all sessions repeat times at once, return the Stats"""
+    stats = Stats()
+    threads = []
+    start_at = time.time() + 1
+    for _ in range(repeat):
+        for s in sessions:
+            urls = create_session(s['config'], len(s['participants']))
+            for url, recorded in zip(urls, s['participants']):
+                threads.append(threading.Thread(
+                    target=replay_participant,
+                    args=(url, recorded, speedup, stats, start_at)
+                ))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats.duration = time.time() - start_at
+    return stats
+
+
+def summary(speedup, stats):
+    lat = sorted(stats.latencies)
+    n = len(lat)
+
+    def pct(q):
+        return lat[min(n - 1, int(q * n))] * 1000 if n else None
+
+    return [
+        f"{speedup:g}x", stats.participants, stats.finished, n,
+        n / stats.duration, pct(0.5), pct(0.95), pct(0.99),
+        lat[-1] * 1000 if n else None,
+        stats.errors / n if n else None,
+        stats.rejected / stats.submits if stats.submits else None,
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded bot runs against an oTree server"
+    )
+    parser.add_argument('--db', default=BOTEX_DB)
+    parser.add_argument('--session', help="only replay this session id")
+    parser.add_argument(
+        '--speedup', type=float, nargs='+', default=[1, 10, 100]
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help="replay each session this many times in parallel"
+    )
+    args = parser.parse_args()
+
+    sessions = recorded_sessions(args.db, args.session)
+    if not sessions:
+        raise SystemExit("No completed bot sessions found.")
+    rows = [
+        summary(speedup, replay(sessions, speedup, args.repeat))
+        for speedup in args.speedup
+    ]
+    print(tabulate(rows, floatfmt='.3g', headers=[
+        'speed-up', 'participants', 'finished', 'requests', 'req/s',
+        'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'error rate', 'rejected'
+    ]))
@@ -0,0 +1,91 @@
+import argparse
+import csv
+from collections import defaultdict
+
+from tabulate import tabulate
+
+# Reports how long each participant waited on wait pages, based on the page
+# times that oTree exports (Data > Page times, PageTimes-*.csv). Use it to
+# compare a session with fixed groups (e.g. mftrust) with one that groups
+# bots by arrival time (e.g. mftrust_arrival): idle bots still hold a browser
+# and memory while they wait.
+#
+#   python code/report_idle_time.py PageTimes-2025-01-01.csv [--participants]
+#
+# The idle time on a wait page is the time from completing the previous page
+# to leaving the wait page.
+
+
+def read_page_times(files):
+    """Return {(session_code, participant_code): [(index, time, page, wait)]}"""
+    pages = defaultdict(list)
+    for file in files:
+        with open(file, newline='') as f:
+            for r in csv.DictReader(f):
+                pages[(r['session_code'], r['participant_code'])].append((
+                    int(r['page_index']), int(r['epoch_time_completed']),
+                    f"{r['app_name']}/{r['page_name']}/{r['round_number']}",
+                    r['is_wait_page'] in ('1', 'True')
+                ))
+    return pages
+
+
+def idle_times(pages):
+    """Return [(session, participant, app, idle s, total s, wait pages)]"""
+    rows = []
+    for (session, participant), visits in pages.items():
+        visits.sort()
+        idle, waits = 0, 0
+        for prev, cur in zip(visits, visits[1:]):
+            if cur[3]:
+                idle += cur[1] - prev[1]
+                waits += 1
+        total = visits[-1][1] - visits[0][1]
+        # InitializeParticipant has no app name
+        app = next((v[2].split('/')[0] for v in visits if v[2][0] != '/'), '')
+        rows.append((session, participant, app, idle, total, waits))
+    return rows
+
+
+def session_summary(rows):
+    by_session = defaultdict(list)
+    for r in rows:
+        by_session[(r[0], r[2])].append(r)
+    table = []
+    for (session, app), rs in sorted(by_session.items()):
+        idle = sorted(r[3] for r in rs)
+        total = sum(r[4] for r in rs)
+        table.append([
+            session, app, len(rs), sum(idle) / len(idle),
+            idle[int(0.95 * (len(idle) - 1))], idle[-1],
+            sum(idle) / total if total else None
+        ])
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Idle time on wait pages from oTree page times"
+    )
+    parser.add_argument('files', nargs='+', help="oTree PageTimes CSV files")
+    parser.add_argument(
+        '--participants', action='store_true',
+        help="also list the idle time of every participant"
+    )
+    args = parser.parse_args()
+
+    rows = idle_times(read_page_times(args.files))
+    print(tabulate(
+        session_summary(rows), floatfmt='.1f', headers=[
+            'session', 'app', 'participants', 'mean idle s', 'p95 idle s',
+            'max idle s', 'idle share'
+        ]
+    ))
+    if args.participants:
+        print()
+        print(tabulate(
+            sorted(rows), headers=[
+                'session', 'participant', 'app', 'idle s', 'total s',
+                'wait pages'
+            ]
+        ))
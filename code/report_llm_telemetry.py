@@ -0,0 +1,77 @@
+import sqlite3
+
+from tabulate import tabulate
+
+# Aggregates the LLM call telemetry that botex_telemetry.py records in the
+# botex database, by session, page and model, and reports the cost per
+# completed session and the share of prompt tokens served from the
+# prompt cache for each model.
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+
+conn = sqlite3.connect(BOTEX_DB)
+
+by_page = conn.execute("""
+    SELECT session_name, page, model, count(*),
+        sum(prompt_tokens), sum(completion_tokens), sum(cached_tokens),
+        avg(latency), max(latency), sum(retries),
+        sum(status = 'error'), sum(cost)
+    FROM llm_calls
+    GROUP BY session_name, page, model
+    ORDER BY session_name, model, min(time_start)
+""").fetchall()
+print(tabulate(
+    by_page,
+    headers=[
+        "Session", "Page", "Model", "Calls", "Prompt tok.", "Compl. tok.",
+        "Cached tok.", "Mean lat. (s)", "Max lat. (s)", "Retries", "Errors",
+        "Cost ($)"
+    ],
+    floatfmt=".3f"
+))
+print()
+
+# A session counts as completed when all of its bots have a time_out
+per_session = conn.execute("""
+    WITH completed AS (
+        SELECT session_id FROM participants
+        GROUP BY session_id
+        HAVING sum(is_human = 0 AND time_out IS NULL) = 0
+    ), sessions AS (
+        SELECT session_name, session_id, model, sum(cost) AS cost,
+            sum(latency) AS latency
+        FROM llm_calls GROUP BY session_name, session_id, model
+    )
+    SELECT s.session_name, s.model, count(*), count(c.session_id),
+        sum(CASE WHEN c.session_id IS NOT NULL THEN s.cost END)
+            / count(c.session_id),
+        sum(CASE WHEN c.session_id IS NOT NULL THEN s.latency END)
+            / count(c.session_id)
+    FROM sessions s LEFT JOIN completed c USING (session_id)
+    GROUP BY s.session_name, s.model
+""").fetchall()
+cache = conn.execute("""
+    SELECT session_name, model, sum(prompt_tokens), sum(cached_tokens),
+        100.0 * sum(cached_tokens) / sum(prompt_tokens)
+    FROM llm_calls
+    GROUP BY session_name, model
+""").fetchall()
+conn.close()
+print(tabulate(
+    per_session,
+    headers=[
+        "Session", "Model", "Sessions", "Completed",
+        "Cost per completed ($)", "LLM time per completed (s)"
+    ],
+    floatfmt=".3f"
+))
+print()
+
+# Share of prompt tokens that the provider (or llama.cpp) served from its
+# prompt cache because the prompt prefix was identical to an earlier call
+print(tabulate(
+    cache,
+    headers=["Session", "Model", "Prompt tok.", "Cached tok.", "Cached (%)"],
+    floatfmt=".1f"
+))
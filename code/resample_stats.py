@@ -0,0 +1,167 @@
+import argparse
+import csv
+import json
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import botex_reader
+import otree_form_schema
+
+# Bootstrap confidence intervals and permutation tests for every numeric
+# question_id x round x session_name x profile cell of the bot responses.
+#
+# Cells with the same number of observations are stacked into one matrix and
+# resampled together: a bootstrap draw is one index matrix that is applied to
+# all cells at once, a sign-flip permutation test is one matrix product.
+# With --workers, the groups of cells are spread across a process pool.
+#
+# The permutation test is a one-sample sign-flip test of H0: mean equals the
+# value in NULL_VALUES. Cells of questions without a null value only get
+# the bootstrap CI.
+#
+# Answers to choice fields (e.g. the Likert items) are recorded as labels
+# and mapped to their values with the choices of the oTree apps. Answers
+# that are not numeric after that are skipped.
+#
+# Usage: python code/resample_stats.py [--resamples 10000] [--workers 4]
+#                                      [--csv stats.csv]
+
+# Adjust this to where you stored the botex data
+# BOTEX_DB = 'data/external/botex_session_exp.sqlite3'
+BOTEX_DB = 'botex.sqlite3'
+OTREE_DIR = 'otree'
+
+NULL_VALUES = {
+    'id_sent_amount': 50,
+    'id_sent_back_amount': None,
+    'id_payment_amount': 50,
+    'id_effort_level': 5,
+    'id_service_quality': 5,
+}
+RESAMPLES = 10000
+CONFIDENCE = 0.95
+SEED = 266
+# Upper bound for cells x resamples x observations per resampling chunk
+MAX_CHUNK_ELEMENTS = 50_000_000
+
+
+def profile_by_participant(botex_db=BOTEX_DB):
+    """Return {participant_id: profile name} from custom system prompts"""
+    profiles = {}
+    for c in botex_reader.read_conversations_from_botex_db(botex_db=botex_db):
+        prompts = json.loads(c['bot_parms']).get('user_prompts') or {}
+        match = re.match(r"(?s).*?You are (\w+), a", prompts.get('system', ''))
+        profiles[c['id']] = match.group(1) if match else ''
+    return profiles
+
+
+def numeric_cells(botex_db=BOTEX_DB, otree_dir=OTREE_DIR):
+    """Return {(session_name, profile, question_id, round): answers}"""
+    part = botex_reader.read_participants_from_botex_db(botex_db=botex_db)
+    session_names = {p['session_id']: p['session_name'] for p in part}
+    profiles = profile_by_participant(botex_db)
+    fields = otree_form_schema.session_fields(otree_dir)
+    cells = defaultdict(list)
+    for r in botex_reader.read_responses_from_botex_db(botex_db=botex_db):
+        session_name = session_names.get(r['session_id'], '')
+        prop = fields.get(session_name, {}).get(
+            r['question_id'].removeprefix('id_'), {}
+        )
+        try:
+            answer = float(otree_form_schema.choice_value(prop, r['answer']))
+        except (TypeError, ValueError):
+            continue
+        cells[(
+            session_name, profiles.get(r['participant_id'], ''),
+            r['question_id'], r['round']
+        )].append(answer)
+    return dict(cells)
+
+
+def resample_group(x, null, resamples=RESAMPLES, seed=SEED):
+    """Bootstrap CIs and sign-flip p-values for cells of equal size
+
+    x is a (cells, n) matrix, null a vector of null values (NaN = no test).
+    Returns a (cells, 4) matrix with CI low, CI high, p-value and the
+    standard error of the mean.
+    """
+    rng = np.random.default_rng(seed)
+    cells, n = x.shape
+    chunk = max(1, MAX_CHUNK_ELEMENTS // (cells * n))
+    boot = np.empty((cells, resamples))
+    exceed = np.zeros(cells)
+    centered = x - np.nan_to_num(null)[:, None]
+    observed = np.abs(centered.mean(axis=1))
+    for start in range(0, resamples, chunk):
+        b = min(chunk, resamples - start)
+        idx = rng.integers(0, n, size=(b, n))
+        boot[:, start:start + b] = x[:, idx].mean(axis=2)
+        signs = rng.choice((-1.0, 1.0), size=(b, n))
+        perm = np.abs(centered @ signs.T) / n
+        exceed += (perm >= observed[:, None] - 1e-12).sum(axis=1)
+    alpha = (1 - CONFIDENCE) / 2
+    low, high = np.quantile(boot, (alpha, 1 - alpha), axis=1)
+    p = np.where(np.isnan(null), np.nan, (exceed + 1) / (resamples + 1))
+    return np.column_stack((low, high, p, boot.std(axis=1, ddof=1)))
+
+
+def _resample_task(args):
+    return resample_group(*args)
+
+
+def resample_stats(cells, resamples=RESAMPLES, workers=None):
+    """Return one result row per cell, sorted by cell key"""
+    by_size = defaultdict(list)
+    for key, answers in cells.items():
+        if len(answers) > 1:
+            by_size[len(answers)].append(key)
+    tasks = []
+    for n, keys in by_size.items():
+        x = np.array([cells[k] for k in keys])
+        null = np.array([
+            np.nan if NULL_VALUES.get(k[2]) is None else NULL_VALUES[k[2]]
+            for k in keys
+        ])
+        tasks.append((x, null, resamples, SEED + n))
+    if workers:
+        with ProcessPoolExecutor(workers) as ex:
+            results = list(ex.map(_resample_task, tasks))
+    else:
+        results = [_resample_task(t) for t in tasks]
+    rows = []
+    for (x, null, _, _), res, keys in zip(
+            tasks, results, by_size.values()):
+        for key, xi, nul, (low, high, p, se) in zip(keys, x, null, res):
+            rows.append((
+                *key, len(xi), xi.mean(), se, low, high,
+                None if np.isnan(nul) else nul,
+                None if np.isnan(p) else p
+            ))
+    return sorted(rows, key=lambda r: tuple(map(str, r[:4])))
+
+
+HEADERS = [
+    "Session", "Profile", "Question", "Round", "N", "Mean", "Boot. SE",
+    "CI low", "CI high", "H0 mean", "Perm. p"
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bootstrap CIs and permutation tests for bot responses"
+    )
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--csv', help="write the results to this file")
+    args = parser.parse_args()
+    rows = resample_stats(numeric_cells(), args.resamples, args.workers)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(HEADERS)
+            w.writerows(rows)
+    else:
+        from tabulate import tabulate
+        print(tabulate(rows, headers=HEADERS, floatfmt=".3f"))
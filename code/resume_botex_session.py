@@ -0,0 +1,141 @@
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import botex
+
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+# Resumes a bot session that died halfway (network blip, Chrome OOM, ...).
+# Bots that already finished are left alone, so their LLM calls are not paid
+# for again. Unfinished bots are restarted on their participant URL. oTree
+# keeps track of the page each participant is on, so a restarted bot
+# continues at its current page.
+#
+# A bot counts as finished if oTree shows it the end of the session. If the
+# oTree server cannot be reached, the time_out column of the botex
+# participants table decides. The two can disagree, e.g. when a bot
+# submitted its last page but died before botex recorded time_out.
+#
+# The conversation of a restarted bot begins at the page it continues on,
+# not at the first page. Round numbers that are inferred from a conversation
+# (botex.read_responses_from_botex_db, code/botex_reader.py) therefore start
+# at 1 again for the rounds the bot played after the restart. The page each
+# bot continues on is logged, so that rounds can be matched by hand.
+#
+# Usage: python code/resume_botex_session.py <session_id> [max_attempts]
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+OTREE_SERVER_URL = os.environ.get('OTREE_SERVER_URL', 'http://localhost:8000')
+OTREE_REST_KEY = os.environ.get('OTREE_REST_KEY')
+MAX_ATTEMPTS = 3
+SECONDS_BETWEEN_ATTEMPTS = 30
+TIMEOUT_SECONDS = 60
+END_PAGE = 'OutOfRangeNotification'
+
+
+def otree_pages(session_id, urls, server=OTREE_SERVER_URL):
+    """Return {url: page} with the current oTree page of each participant
+
+    The participants of the session are read with the oTree REST API. Each
+    participant URL redirects to the page the participant is on. Returns
+    None if the oTree server cannot be reached.
+    """
+    req = urllib.request.Request(
+        f"{server}/api/sessions/{session_id}",
+        headers={'otree-rest-key': OTREE_REST_KEY or ''}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=TIMEOUT_SECONDS) as r:
+            codes = {p['code'] for p in json.loads(r.read())['participants']}
+        pages = {}
+        for url in urls:
+            if url.rstrip('/').rsplit('/', 1)[-1] not in codes:
+                continue
+            with urllib.request.urlopen(url, timeout=TIMEOUT_SECONDS) as r:
+                pages[url] = r.geturl()
+    except (urllib.error.URLError, OSError) as e:
+        logging.warning(f"Cannot read the oTree state of {session_id}: {e}")
+        return None
+    return pages
+
+
+def unfinished_bot_urls(session_id, botex_db=BOTEX_DB):
+    """Return the URLs of all bot participants that have not completed"""
+    part = botex.read_participants_from_botex_db(
+        session_id=session_id, botex_db=botex_db
+    )
+    bots = [p for p in part if not p['is_human']]
+    pages = otree_pages(session_id, [p['url'] for p in bots])
+    if pages is None:
+        return [p['url'] for p in bots if p['time_out'] is None]
+    urls = []
+    for p in bots:
+        page = pages.get(p['url'])
+        finished = END_PAGE in page if page else p['time_out'] is not None
+        if finished != (p['time_out'] is not None):
+            logging.warning(
+                f"{p['participant_id']}: oTree and the botex database "
+                f"disagree, {'finished' if finished else 'unfinished'} "
+                f"in oTree (page {page})"
+            )
+        if not finished:
+            if page:
+                logging.info(f"{p['participant_id']} continues at {page}")
+            urls.append(p['url'])
+    return urls
+
+
+def run_with_resume(
+        session_id, botex_db=BOTEX_DB, max_attempts=MAX_ATTEMPTS, **kwargs
+    ):
+    """Run (or resume) the bots of a session until all of them completed
+
+    Additional keyword arguments are passed on to
+    botex.run_bots_on_session(), e.g. model or user_prompts.
+    Returns the list of bot URLs that are still unfinished after
+    max_attempts (empty on success).
+    """
+    for attempt in range(1, max_attempts + 1):
+        urls = unfinished_bot_urls(session_id, botex_db)
+        if not urls:
+            break
+        logging.info(
+            f"Attempt {attempt}/{max_attempts}: running {len(urls)} "
+            f"unfinished bot(s) on session {session_id}"
+        )
+        try:
+            botex.run_bots_on_session(
+                session_id=session_id, bot_urls=urls, botex_db=botex_db,
+                **kwargs
+            )
+        except Exception:
+            logging.exception(f"Bot run on session {session_id} failed")
+            if attempt < max_attempts:
+                time.sleep(SECONDS_BETWEEN_ATTEMPTS)
+    return unfinished_bot_urls(session_id, botex_db)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(
+            "Usage: python code/resume_botex_session.py "
+            "<session_id> [max_attempts]"
+        )
+    session_id = sys.argv[1]
+    max_attempts = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_ATTEMPTS
+    remaining = run_with_resume(session_id, max_attempts=max_attempts)
+    if remaining:
+        print(f"{len(remaining)} bot(s) still unfinished:")
+        for url in remaining:
+            print(f"  {url}")
+        sys.exit(1)
+    print(f"All bots on session {session_id} completed.")
@@ -1,19 +1,42 @@
 import logging
 logging.basicConfig(level=logging.INFO)
 
+import os
+
 import botex 
 
 from dotenv import load_dotenv
 load_dotenv('secrets.env')
 
+# WAL mode lets many parallel bots write to the botex database
+# without running into "database is locked" errors
+from botex_db_writer import enable_wal
+enable_wal(os.environ.get('BOTEX_DB', 'botex.sqlite3'))
+
 # Choose which game to run by changing the config_name:
 # "mftrust" for the original trust game
 # "grief_support" for the new grief support interaction game
 
 # Run the grief_support game (new)
 grief_support = botex.init_otree_session(config_name = "grief_support", npart = 2)
-botex.run_bots_on_session(session_id = grief_support['session_id'])
+
+# Record tokens, latency and cost of all LLM calls in the botex database
+# (see code/report_llm_telemetry.py)
+import botex_telemetry
+botex_telemetry.install(os.environ.get('BOTEX_DB', 'botex.sqlite3'))
+
+try:
+    botex.run_bots_on_session(
+        session_id = grief_support['session_id'],
+        **botex_telemetry.tag("grief_support", grief_support['session_id'])
+    )
+finally:
+    # Writes the queued telemetry rows also if the bots fail
+    botex_telemetry.uninstall()
 
 # Uncomment the lines below to run the mftrust game instead:
 # mftrust = botex.init_otree_session(config_name = "mftrust", npart = 2)
-# botex.run_bots_on_session(session_id = mftrust['session_id'])
\ No newline at end of file
+# botex.run_bots_on_session(session_id = mftrust['session_id'])
+
+# If a long run dies halfway, resume the unfinished bots with:
+# python code/resume_botex_session.py <session_id>
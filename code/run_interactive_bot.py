@@ -0,0 +1,201 @@
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import argparse
+import ast
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import botex
+import litellm
+
+import botex_telemetry
+import otree_form_schema
+
+from dotenv import load_dotenv
+load_dotenv('secrets.env')
+
+# Runs a single bot that plays with a human participant (e.g. on one link of
+# an mftrust session, see README) and measures how long the human waits for
+# the bot's moves.
+#
+# - The model connection is warmed up with a tiny request before the bot
+#   starts, so the first move does not pay for connection setup, and kept
+#   warm with the same request every --keep-warm seconds while the bot
+#   waits for the human. This is skipped for the local llama.cpp model
+#   ("llamacpp"), whose server keeps the model loaded anyway.
+# - Every LLM call is recorded with botex_telemetry. After the run, the time
+#   the bot spent on each decision page is compared with P95_TARGET_SECONDS.
+#   Decision pages are the form pages that a partner waits for, i.e. those
+#   followed by a wait page in the page_sequence of the app. The time of a
+#   page runs from the start of its first LLM call to the end of its last
+#   one (including retries), so it does not include loading and submitting
+#   the page.
+#
+# Apart from the warm-up, the bot runs with the defaults of
+# botex.run_single_bot(). Streaming the response and submitting before the
+# reasons are complete are not possible from here: botex requests the
+# answers and reasons as one JSON object and only fills in the page when it
+# has parsed all of it.
+#
+# Usage: python code/run_interactive_bot.py <participant url> [--model ...]
+
+BOTEX_DB = os.environ.get('BOTEX_DB', 'botex.sqlite3')
+OTREE_DIR = 'otree'
+MODEL = "gpt-4o-mini"
+LOCAL_MODEL = "llamacpp"
+P95_TARGET_SECONDS = 10
+KEEP_WARM_SECONDS = 60
+
+
+def warm_up(model, **kwargs):
+    """Send a minimal request so that the connection is ready
+
+    Returns the time it took or None if the request failed. A failed
+    warm-up is logged and does not stop the bot.
+    """
+    start = time.perf_counter()
+    try:
+        litellm.completion(
+            model=model, max_tokens=1,
+            messages=[{'role': 'user', 'content': 'Reply with OK.'}],
+            **kwargs
+        )
+    except Exception:
+        logging.exception(f"Warm-up request to {model} failed")
+        return None
+    return time.perf_counter() - start
+
+
+def keep_warm(stop, seconds, model, **kwargs):
+    """Repeat the warm-up every seconds until stop is set"""
+    while not stop.wait(seconds):
+        warm_up(model, **kwargs)
+
+
+def _wait_pages_and_sequence(app_path):
+    with open(os.path.join(app_path, '__init__.py')) as f:
+        tree = ast.parse(f.read())
+    wait_pages, sequence = set(), []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and any(
+                getattr(b, 'id', None) == 'WaitPage' for b in node.bases):
+            wait_pages.add(node.name)
+        elif (
+            isinstance(node, ast.Assign)
+            and getattr(node.targets[0], 'id', None) == 'page_sequence'
+        ):
+            sequence = [e.id for e in node.value.elts]
+    return wait_pages, sequence
+
+
+def decision_page_titles(otree_dir=OTREE_DIR):
+    """Return the titles of form pages that are followed by a wait page"""
+    titles = set()
+    for app, forms in otree_form_schema.all_schemas(otree_dir).items():
+        wait_pages, sequence = _wait_pages_and_sequence(
+            os.path.join(otree_dir, app)
+        )
+        for page, following in zip(sequence, sequence[1:]):
+            template = os.path.join(otree_dir, app, f"{page}.html")
+            if (
+                page in forms and following in wait_pages
+                and os.path.exists(template)
+            ):
+                with open(template) as f:
+                    titles.update(
+                        t.strip() for t in
+                        botex_telemetry.TEMPLATE_TITLE.findall(f.read())
+                    )
+    return titles
+
+
+def decision_page_times(botex_db, session_name, titles):
+    """Return the sorted times in seconds the bot spent on decision pages
+
+    Consecutive calls for the same page belong to one visit: the page
+    prompt (no retries) starts a new one. Calls without a page, such as
+    the keep-warm requests, are left out.
+    """
+    conn = sqlite3.connect(botex_db)
+    visits = []
+    for page, retries, start, end in conn.execute(
+        "SELECT page, retries, time_start, time_end FROM llm_calls "
+        "WHERE session_name = ? AND page IS NOT NULL ORDER BY time_start",
+        (session_name,)
+    ):
+        if retries == 0 or not visits or visits[-1][0] != page:
+            visits.append([page, start, end])
+        else:
+            visits[-1][2] = end
+    conn.close()
+    return sorted(
+        (
+            datetime.fromisoformat(end) - datetime.fromisoformat(start)
+        ).total_seconds()
+        for page, start, end in visits if page in titles
+    )
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(
+        len(sorted_values) - 1, int(q * len(sorted_values))
+    )]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bot for sessions with humans, with move times"
+    )
+    parser.add_argument('url', help="participant URL for the bot")
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--api-base', default=None)
+    parser.add_argument(
+        '--target', type=float, default=P95_TARGET_SECONDS,
+        help="p95 target for the time per decision page in seconds"
+    )
+    parser.add_argument(
+        '--keep-warm', type=float, default=KEEP_WARM_SECONDS,
+        help="seconds between keep-warm requests, 0 to turn them off"
+    )
+    args = parser.parse_args()
+
+    # Telemetry rows of this run are tagged with the participant id
+    run_name = f"interactive-{args.url.rstrip('/').split('/')[-1]}"
+    extra = {'api_base': args.api_base} if args.api_base else {}
+    stop = threading.Event()
+    if args.model != LOCAL_MODEL:
+        took = warm_up(args.model, **extra)
+        if took is not None:
+            logging.info(f"Warm-up took {took:.2f}s")
+        if args.keep_warm > 0:
+            threading.Thread(
+                target=keep_warm, args=(stop, args.keep_warm, args.model),
+                kwargs=extra, daemon=True
+            ).start()
+
+    botex_telemetry.install(BOTEX_DB)
+    try:
+        botex.run_single_bot(
+            url=args.url, botex_db=BOTEX_DB, model=args.model, **extra,
+            **botex_telemetry.tag(run_name)
+        )
+    finally:
+        stop.set()
+        botex_telemetry.uninstall()
+
+    times = decision_page_times(BOTEX_DB, run_name, decision_page_titles())
+    if not times:
+        raise SystemExit("No LLM calls on decision pages were recorded.")
+    p50, p95 = percentile(times, 0.5), percentile(times, 0.95)
+    print(f"Decision pages: {len(times)}, p50: {p50:.2f}s, p95: {p95:.2f}s "
+          f"(target {args.target:.0f}s)")
+    if p95 > args.target:
+        raise SystemExit(
+            "p95 time per decision page above target. Consider a faster "
+            "model or a local model on the llama.cpp pool "
+            "(llama_server_pool.py)."
+        )
@@ -0,0 +1,121 @@
+import argparse
+import codecs
+import json
+import sqlite3
+
+from tabulate import tabulate
+
+from conversation_store import is_compact, read_compact_conversation
+
+# Shows the prompt sequence of a single bot, one page of messages at a time.
+#
+# Unlike display_botex_prompt_sequence.py, this does not read all
+# conversations. It fetches the one conversation it needs and parses the
+# stored JSON incrementally: it reads the row in chunks and stops as soon as
+# the requested messages are decoded. Inspecting one transcript is instant
+# and needs little memory, also in databases with many conversations.
+#
+#   python code/view_botex_conversation.py --session s7gca5qt
+#   python code/view_botex_conversation.py --participant qov13j4h --page 2
+#
+# Works with plain and with compact (conversation_store.py) databases.
+
+# Adjust this to where you stored the botex data
+BOTEX_DB = 'botex.sqlite3'
+PAGE_SIZE = 5
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_messages(conn, participant_id, chunk_size=CHUNK_SIZE):
+    """Yield the messages of one stored conversation, parsed on the fly"""
+    row = conn.execute(
+        "SELECT rowid FROM conversations WHERE id = ?", (participant_id,)
+    ).fetchone()
+    if row is None:
+        return
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    with conn.blobopen(
+            'conversations', 'conversation', row[0], readonly=True) as blob:
+        buf, pos, eof = '', 0, False
+        started = False
+        while True:
+            # Skip separators between the messages
+            while pos < len(buf) and buf[pos] in ' \t\r\n,[':
+                started = started or buf[pos] == '['
+                pos += 1
+            if started and pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                if pos >= len(buf):
+                    raise ValueError("need more data")
+                message, pos = decoder.raw_decode(buf, pos)
+                yield message
+                continue
+            except ValueError:
+                if eof:
+                    raise
+            chunk = blob.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+
+
+def messages_page(botex_db, participant_id, page=1, page_size=PAGE_SIZE):
+    """Return (first message number, messages) of one page of a transcript"""
+    first = (page - 1) * page_size
+    conn = sqlite3.connect(f"file:{botex_db}?mode=ro", uri=True)
+    try:
+        if is_compact(conn):
+            messages = read_compact_conversation(conn, participant_id) or []
+            return first + 1, messages[first:first + page_size]
+        selected = []
+        for i, message in enumerate(iter_messages(conn, participant_id)):
+            if i >= first + page_size:
+                break
+            if i >= first:
+                selected.append(message)
+        return first + 1, selected
+    finally:
+        conn.close()
+
+
+def session_participants(botex_db, session_id):
+    conn = sqlite3.connect(f"file:{botex_db}?mode=ro", uri=True)
+    rows = conn.execute(
+        "SELECT participant_id, is_human, time_in, time_out "
+        "FROM participants WHERE session_id = ?", (session_id,)
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show the prompt sequence of one bot"
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--participant', help="participant id of the bot")
+    group.add_argument('--session', help="list the participants of a session")
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--db', default=BOTEX_DB)
+    args = parser.parse_args()
+
+    if args.session:
+        print(tabulate(
+            session_participants(args.db, args.session),
+            headers=["Participant ID", "Is Human?", "Time in", "Time out"]
+        ))
+    else:
+        first, messages = messages_page(
+            args.db, args.participant, args.page, args.page_size
+        )
+        if not messages:
+            raise SystemExit(
+                f"No messages on page {args.page} for {args.participant}"
+            )
+        print(tabulate(
+            messages, headers="keys",
+            showindex=range(first, first + len(messages))
+        ))
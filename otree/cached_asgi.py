@@ -0,0 +1,186 @@
+import gzip
+import os
+
+from otree.asgi import app as otree_app
+
+# oTree app with caching for bot-heavy sessions, started by
+# cached_prodserver.py:
+#
+# - Static files (/static/...) are read and gzip-compressed once and then
+#   served from memory, with Cache-Control so that a browser does not ask
+#   for them again on every page. ETags still allow revalidation.
+# - Pages are only gzip-compressed on the fly with OTREE_GZIP_PAGES=1, and
+#   then with a low level. oTree runs a single worker, so compressing every
+#   page delays all other requests; bots on the same machine or network do
+#   not gain much from smaller pages.
+#
+# oTree itself already keeps compiled templates in memory. Static files are
+# cached until the server restarts.
+
+STATIC_MAX_AGE = 86400
+MIN_GZIP_SIZE = 500
+GZIP_PAGES = os.environ.get('OTREE_GZIP_PAGES', '') not in ('', '0')
+PAGE_GZIP_LEVEL = 1
+COMPRESSIBLE = (
+    b'text/', b'application/javascript', b'application/json',
+    b'image/svg+xml',
+)
+
+
+class StaticCache:
+    """Serves 200 responses for /static/ from memory"""
+
+    def __init__(self, app, static_app):
+        self.app = app
+        self.static_app = static_app
+        self.cache = {}
+
+    async def _load(self, scope):
+        # Ask the static app without conditional headers, with the path
+        # relative to the /static mount like oTree's router does
+        scope = dict(
+            scope, method='GET', path=scope['path'][len('/static'):],
+            root_path=scope.get('root_path', '') + '/static',
+            headers=[
+                (k, v) for k, v in scope['headers']
+                if k not in (b'if-none-match', b'if-modified-since')
+            ]
+        )
+        response = {'body': b''}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = message['headers']
+            else:
+                response['body'] += message.get('body', b'')
+
+        await self.static_app(scope, receive, send)
+        if response['status'] != 200:
+            return None
+        headers = [
+            (k, v) for k, v in response['headers']
+            if k in (b'content-type', b'etag', b'last-modified')
+        ]
+        headers.append(
+            (b'cache-control', f"public, max-age={STATIC_MAX_AGE}".encode())
+        )
+        body = response['body']
+        gz = None
+        content_type = dict(headers).get(b'content-type', b'')
+        if len(body) >= MIN_GZIP_SIZE and content_type.startswith(COMPRESSIBLE):
+            gz = gzip.compress(body, 9)
+            if len(gz) >= len(body):
+                gz = None
+        return headers, body, gz
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD')
+            or not scope['path'].startswith('/static/')
+        ):
+            await self.app(scope, receive, send)
+            return
+        entry = self.cache.get(scope['path'])
+        if entry is None:
+            entry = await self._load(scope)
+            if entry is None:
+                await self.app(scope, receive, send)
+                return
+            self.cache[scope['path']] = entry
+        headers, body, gz = entry
+        request = dict(scope['headers'])
+        etag = dict(headers).get(b'etag')
+        if etag and request.get(b'if-none-match') == etag:
+            await send({
+                'type': 'http.response.start', 'status': 304,
+                'headers': headers
+            })
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        headers = headers + [(b'vary', b'accept-encoding')]
+        if gz and b'gzip' in request.get(b'accept-encoding', b''):
+            body = gz
+            headers.append((b'content-encoding', b'gzip'))
+        headers.append((b'content-length', str(len(body)).encode()))
+        await send({
+            'type': 'http.response.start', 'status': 200, 'headers': headers
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'' if scope['method'] == 'HEAD' else body
+        })
+
+
+class PageGZip:
+    """Compresses page responses with PAGE_GZIP_LEVEL
+
+    Only responses with a Content-Length are compressed: their body is
+    collected (oTree sends it in several messages) and sent at once.
+    Streamed responses are passed on unchanged.
+    """
+
+    def __init__(self, app, minimum_size=MIN_GZIP_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http'
+            or b'gzip' not in dict(scope['headers']).get(
+                b'accept-encoding', b''
+            )
+        ):
+            await self.app(scope, receive, send)
+            return
+        start = None
+        body = []
+
+        async def send_gzip(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                headers = dict(message['headers'])
+                size = int(headers.get(b'content-length', 0))
+                if (
+                    size >= self.minimum_size
+                    and headers.get(b'content-type', b'').startswith(
+                        COMPRESSIBLE
+                    )
+                    and b'content-encoding' not in headers
+                ):
+                    start = message
+                    return
+            elif message['type'] == 'http.response.body' and start:
+                body.append(message.get('body', b''))
+                if message.get('more_body', False):
+                    return
+                gz = gzip.compress(b''.join(body), PAGE_GZIP_LEVEL)
+                headers = [
+                    (k, v) for k, v in start['headers']
+                    if k != b'content-length'
+                ] + [
+                    (b'content-encoding', b'gzip'),
+                    (b'content-length', str(len(gz)).encode()),
+                    (b'vary', b'accept-encoding'),
+                ]
+                await send(dict(start, headers=headers))
+                await send({'type': 'http.response.body', 'body': gz})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_gzip)
+
+
+def _static_app():
+    from otree.common2 import static_files_app
+    return static_files_app
+
+
+app = StaticCache(
+    PageGZip(otree_app, minimum_size=MIN_GZIP_SIZE) if GZIP_PAGES
+    else otree_app,
+    _static_app()
+)
@@ -0,0 +1,36 @@
+import sys
+
+# Runs "otree prodserver" with the caching app from cached_asgi.py instead
+# of the plain oTree app. Use it like otree prodserver, from this folder:
+#
+#   python cached_prodserver.py 8000
+#   OTREE_GZIP_PAGES=1 python cached_prodserver.py 8000  # also gzip pages
+#
+# Compare both with code/benchmark_page_load.py.
+
+sys.argv[:] = ['otree', 'prodserver', *sys.argv[1:]]
+
+import otree.cli.prodserver1of2 as prodserver
+from otree.main import execute_from_command_line
+
+
+def run_uvicorn(addr, port, *, is_devserver):
+    from uvicorn.main import Config, Server
+
+    # Same settings as oTree's own run_uvicorn(), except for the app
+    config = Config(
+        'cached_asgi:app',
+        host=addr,
+        port=int(port),
+        log_level='warning' if is_devserver else "info",
+        log_config=None,
+        workers=1,
+        ws='websockets',
+    )
+    Server(config=config).run()
+
+
+prodserver.run_uvicorn = run_uvicorn
+
+if __name__ == "__main__":
+    execute_from_command_line()
@@ -160,6 +160,20 @@ def creating_session(subsession: Subsession):
 def effort_level_max(group: Group):
     return 10
 
+def group_by_arrival_time_method(subsession: Subsession, waiting_players):
+    """Used if the session config sets arrival_matching, see ArrivalWaitPage
+    In round 1, the first two players that are ready form a group. When
+    groups are re-matched in later rounds, a grief-stricken person is paired
+    with a service provider, so that everybody keeps their role."""
+    if subsession.round_number == 1:
+        if len(waiting_players) >= 2:
+            return waiting_players[:2]
+        return
+    clients = [p for p in waiting_players if p.in_round(1).id_in_group == 1]
+    providers = [p for p in waiting_players if p.in_round(1).id_in_group == 2]
+    if clients and providers:
+        return [clients[0], providers[0]]
+
 def set_payoffs(group: Group):
     p1 = group.get_player_by_id(1)  # Grief-stricken person
     p2 = group.get_player_by_id(2)  # Service provider
@@ -180,6 +194,21 @@ def set_payoffs(group: Group):
 
 # --- Pages --------------------------------------------------------------------
     
+class ArrivalWaitPage(WaitPage):
+    """Groups players in the order in which they arrive, so that a fast bot
+    does not wait for a slow partner that was assigned at session start.
+    Only displayed if the session config sets arrival_matching. Groups are
+    formed in round 1 and kept, unless rematch_every_round is set."""
+
+    group_by_arrival_time = True
+
+    @staticmethod
+    def is_displayed(player):
+        config = player.session.config
+        if not config.get('arrival_matching'):
+            return False
+        return player.round_number == 1 or config.get('rematch_every_round')
+
 class Introduction(Page):
     @staticmethod
     def is_displayed(player):
@@ -215,7 +244,9 @@ class Response(Page):
     @staticmethod
     def vars_for_template(player: Player):
         group = player.group
-        initial_message = group.in_round(1).initial_message
+        # The service provider may have been in another group in round 1
+        provider = group.get_player_by_id(2)
+        initial_message = provider.in_round(1).group.initial_message
         message_exists = initial_message != ""
         return dict(message_exists=message_exists, initial_message=initial_message)
 
@@ -287,6 +318,7 @@ class Thanks(Page):
         )
 
 page_sequence = [
+    ArrivalWaitPage,
     Introduction,
     InitialMessage,
     MessageWaitPage,
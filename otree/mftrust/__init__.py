@@ -131,6 +131,20 @@ def creating_session(subsession: Subsession):
 def sent_back_amount_max(group: Group):
     return group.sent_amount * C.MULTIPLIER
 
+def group_by_arrival_time_method(subsession: Subsession, waiting_players):
+    """Used if the session config sets arrival_matching, see ArrivalWaitPage
+    In round 1, the first two players that are ready form a group. When
+    groups are re-matched in later rounds, an investor is paired with a
+    manager, so that everybody keeps their role from round 1."""
+    if subsession.round_number == 1:
+        if len(waiting_players) >= 2:
+            return waiting_players[:2]
+        return
+    investors = [p for p in waiting_players if p.in_round(1).id_in_group == 1]
+    managers = [p for p in waiting_players if p.in_round(1).id_in_group == 2]
+    if investors and managers:
+        return [investors[0], managers[0]]
+
 def set_payoffs(group: Group):
     p1 = group.get_player_by_id(1)
     p2 = group.get_player_by_id(2)
@@ -143,6 +157,21 @@ def set_payoffs(group: Group):
 
 # --- Pages --------------------------------------------------------------------
     
+class ArrivalWaitPage(WaitPage):
+    """Groups players in the order in which they arrive, so that a fast bot
+    does not wait for a slow partner that was assigned at session start.
+    Only displayed if the session config sets arrival_matching. Groups are
+    formed in round 1 and kept, unless rematch_every_round is set."""
+
+    group_by_arrival_time = True
+
+    @staticmethod
+    def is_displayed(player):
+        config = player.session.config
+        if not config.get('arrival_matching'):
+            return False
+        return player.round_number == 1 or config.get('rematch_every_round')
+
 class Introduction(Page):
     @staticmethod
     def is_displayed(player):
@@ -181,7 +210,9 @@ class Send(Page):
     @staticmethod
     def vars_for_template(player: Player):
         group = player.group
-        message = group.in_round(1).message
+        # The manager may have been in another group in round 1
+        manager = group.get_player_by_id(2)
+        message = manager.in_round(1).group.message
         message_exists = message != ""
         return dict(message_exists=message_exists, message=message)
 
@@ -257,6 +288,7 @@ class Thanks(Page):
 
 
 page_sequence = [
+    ArrivalWaitPage,
     Introduction,
     Message,
     SendWaitPage,
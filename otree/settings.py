@@ -15,6 +15,23 @@ SESSION_CONFIGS = [
         app_sequence=['grief_support'],
         num_demo_participants=2,
     ),
+    # Same games, but bots are grouped in the order in which they are ready
+    # (see ArrivalWaitPage in the apps). Set rematch_every_round=True to
+    # form new groups in every round instead of keeping the round 1 groups.
+    dict(
+        name='mftrust_arrival',
+        display_name="Trust Game, Grouped by Arrival Time",
+        app_sequence=['mftrust'],
+        num_demo_participants=4,
+        arrival_matching=True,
+    ),
+    dict(
+        name='grief_support_arrival',
+        display_name="Grief Support Game, Grouped by Arrival Time",
+        app_sequence=['grief_support'],
+        num_demo_participants=4,
+        arrival_matching=True,
+    ),
     dict(
         name='stakeholder',
         display_name="A Stakeholder Game",
@@ -29,7 +46,8 @@ SESSION_CONFIGS = [
 # e.g. self.session.config['participation_fee']
 
 SESSION_CONFIG_DEFAULTS = dict(
-    real_world_currency_per_point=1.00, participation_fee=0.00, doc=""
+    real_world_currency_per_point=1.00, participation_fee=0.00, doc="",
+    arrival_matching=False, rematch_every_round=False,
 )
 
 PARTICIPANT_FIELDS = ['wealth', 'part_id', 'well_being']